@@ -12,7 +12,7 @@ from django.db.models import Q
 from common.mixins import IDInFilterMixin
 from common.utils import get_logger
 from ..hands import IsSuperUser, IsValidUser, IsSuperUserOrAppUser, \
-    NodePermissionUtil
+    AssetGrantIndex
 from ..models import  Asset, SystemUser, AdminUser, Node
 from .. import serializers
 from ..tasks import update_asset_hardware_info_manual, \
@@ -50,7 +50,10 @@ class AssetViewSet(IDInFilterMixin, LabelFilter, BulkModelViewSet):
         if node_id:
             node = get_object_or_404(Node, id=node_id)
             if not node.is_root():
-                queryset = queryset.filter(nodes__key__startswith=node.key).distinct()
+                queryset = queryset.filter(
+                    Q(nodes__key=node.key) |
+                    Q(nodes__key__startswith=node.children_key_prefix)
+                ).distinct()
         return queryset
 
 
@@ -60,10 +63,8 @@ class UserAssetListView(generics.ListAPIView):
     permission_classes = (IsValidUser,)
 
     def get_queryset(self):
-        assets_granted = NodePermissionUtil.get_user_assets(self.request.user).keys()
-        queryset = self.queryset.filter(
-            id__in=[asset.id for asset in assets_granted]
-        )
+        assets_id = AssetGrantIndex.get_user_assets_id(self.request.user)
+        queryset = self.queryset.filter(id__in=assets_id)
         return queryset
 
 
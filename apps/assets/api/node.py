@@ -13,16 +13,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import Counter
+
 from rest_framework import generics, mixins
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework_bulk import BulkModelViewSet
 from django.utils.translation import ugettext_lazy as _
 from django.shortcuts import get_object_or_404
+from django.db import transaction, IntegrityError
 
-from common.utils import get_logger, get_object_or_none
+from common.utils import get_logger
 from ..hands import IsSuperUser
-from ..models import Node
+from ..models import Node, NodeTree
+from ..utils import get_nodes_assets_amount
 from ..tasks import update_assets_hardware_info_util, test_asset_connectability_util
 from .. import serializers
 
@@ -32,7 +36,7 @@ __all__ = [
     'NodeViewSet', 'NodeChildrenApi',
     'NodeAddAssetsApi', 'NodeRemoveAssetsApi',
     'NodeAddChildrenApi', 'RefreshNodeHardwareInfoApi',
-    'TestNodeConnectiveApi'
+    'TestNodeConnectiveApi', 'NodesAssetsAmountApi',
 ]
 
 
@@ -54,6 +58,8 @@ class NodeChildrenApi(mixins.ListModelMixin, generics.CreateAPIView):
     instance = None
 
     def post(self, request, *args, **kwargs):
+        if isinstance(request.data, list):
+            return self.bulk_create(request, *args, **kwargs)
         if not request.data.get("value"):
             request.data["value"] = _("New node {}").format(
                 Node.root().get_next_child_key().split(":")[-1]
@@ -69,12 +75,49 @@ class NodeChildrenApi(mixins.ListModelMixin, generics.CreateAPIView):
             status=201,
         )
 
+    def bulk_create(self, request, *args, **kwargs):
+        if not all(isinstance(item, dict) for item in request.data):
+            return Response({"error": "Data should be a list of object"}, status=400)
+        instance = self.get_object()
+        values = [item.get("value") for item in request.data]
+        error = self.validate_values(values)
+        if error:
+            return Response({"error": error}, status=400)
+        try:
+            # Key allocation rollback too if create failed
+            with transaction.atomic():
+                nodes = instance.create_children(values)
+        except IntegrityError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(
+            [{"id": node.id, "key": node.key, "value": node.value} for node in nodes],
+            status=201,
+        )
+
+    @staticmethod
+    def validate_values(values):
+        """
+        Check values before allocate keys, value is unique and limited in
+        length, so a bad one not fail the bulk insert
+        """
+        if not all(isinstance(v, str) and v for v in values):
+            return "Value required"
+        max_length = Node._meta.get_field('value').max_length
+        too_long = [v for v in values if len(v) > max_length]
+        if too_long:
+            return "Value longer than {}: {}".format(max_length, ', '.join(too_long))
+        duplicated = {v for v, count in Counter(values).items() if count > 1}
+        duplicated.update(
+            Node.objects.filter(value__in=values).values_list('value', flat=True)
+        )
+        if duplicated:
+            return "Value already exists: {}".format(', '.join(sorted(duplicated)))
+        return None
+
     def get(self, request, *args, **kwargs):
         instance = self.get_object()
-        if self.request.query_params.get("all"):
-            children = instance.get_all_children()
-        else:
-            children = instance.get_children()
+        all_children = bool(self.request.query_params.get("all"))
+        children = NodeTree.get_children(instance.key, all_children=all_children)
         response = [{"id": node.id, "key": node.key, "value": node.value} for node in children]
         return Response(response, status=200)
 
@@ -88,12 +131,15 @@ class NodeAddChildrenApi(generics.UpdateAPIView):
     def put(self, request, *args, **kwargs):
         instance = self.get_object()
         nodes_id = request.data.get("nodes")
-        children = [get_object_or_none(Node, id=pk) for pk in nodes_id]
+        children = Node.objects.filter(id__in=nodes_id)
+        failed = []
         for node in children:
-            if not node:
-                continue
-            node.parent = instance
-            node.save()
+            try:
+                node.move_to(instance)
+            except (ValueError, Node.DoesNotExist) as e:
+                failed.append("{}: {}".format(node.value, e))
+        if failed:
+            return Response({"error": failed}, status=400)
         return Response("OK")
 
 
@@ -148,3 +194,27 @@ class TestNodeConnectiveApi(APIView):
         test_asset_connectability_util.delay(assets, task_name=task_name)
         return Response({"msg": "Task created"})
 
+
+
+class NodesAssetsAmountApi(APIView):
+    """
+    Assets amount of every node: direct, subtree total and subtree active
+    """
+    permission_classes = (IsSuperUser,)
+
+    def get(self, request, *args, **kwargs):
+        use_cache = request.query_params.get("cache", "1") != "0"
+        amount = get_nodes_assets_amount(use_cache=use_cache)
+        root = Node.root()
+        nodes = [root] + NodeTree.get_children(root.key, all_children=True)
+        default = {"direct": 0, "total": 0, "active": 0}
+        data = []
+        for node in nodes:
+            node_amount = amount.get(node.key, default)
+            data.append({
+                "id": node.id, "key": node.key, "value": node.value,
+                "assets_amount_direct": node_amount["direct"],
+                "assets_amount": node_amount["total"],
+                "assets_amount_active": node_amount["active"],
+            })
+        return Response(data)
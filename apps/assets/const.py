@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 #
 
+# Only gather the min and hardware facts, they are all we store
 UPDATE_ASSETS_HARDWARE_TASKS = [
    {
        'name': "setup",
        'action': {
-           'module': 'setup'
+           'module': 'setup',
+           'args': 'gather_subset=!all,hardware',
        }
    }
 ]
+ASSET_HARDWARE_HASH_CACHE_KEY = "ASSET_HARDWARE_HASH_{}"
 
 ADMIN_USER_CONN_CACHE_KEY = "ADMIN_USER_CONN_{}"
 TEST_ADMIN_USER_CONN_TASKS = [
@@ -32,7 +35,12 @@ TEST_SYSTEM_USER_CONN_TASKS = [
    }
 ]
 
+# Forks is tuned by the runner, timeout is the max one
 TASK_OPTIONS = {
     'timeout': 10,
-    'forks': 10,
 }
+
+NODE_TREE_VERSION_CACHE_KEY = "ASSETS_NODE_TREE_VERSION"
+NODES_ASSETS_AMOUNT_CACHE_KEY = "ASSETS_NODES_ASSETS_AMOUNT_{}"
+ASSETS_INVENTORY_VERSION_CACHE_KEY = "ASSETS_INVENTORY_VERSION"
+ASSETS_CREATED_QUEUE_KEY = "ASSETS_CREATED_QUEUE"
@@ -1,12 +1,96 @@
 # -*- coding: utf-8 -*-
 #
 import uuid
+import copy
+import threading
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q, F, Value
+from django.db.models.functions import Concat, Substr
+from django.core.cache import cache
 from django.utils.translation import ugettext_lazy as _
 
+from ..const import NODE_TREE_VERSION_CACHE_KEY
+from ..signals import on_node_moved
 
-__all__ = ['Node']
+
+__all__ = ['Node', 'NodeTree']
+
+
+class NodeTree:
+    """
+    Process local cache of the whole node tree, the version stored in
+    cache is bumped when any node saved or deleted, then every process
+    reload the tree once when it found the version changed.
+    Nodes returned are copies, change them will not pollute the cache
+    """
+    _version = None
+    _nodes = {}  # {key: node}
+    _children = {}  # {key: [child_key, ..]}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_version():
+        return cache.get(NODE_TREE_VERSION_CACHE_KEY, 0)
+
+    @staticmethod
+    def expire():
+        try:
+            cache.incr(NODE_TREE_VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(NODE_TREE_VERSION_CACHE_KEY, 1, None)
+
+    @classmethod
+    def load(cls, version):
+        nodes = {node.key: node for node in Node.objects.all()}
+        children = {key: [] for key in nodes}
+        for key, node in nodes.items():
+            if node.is_root():
+                continue
+            children.setdefault(node.parent_key, []).append(key)
+        for keys in children.values():
+            keys.sort(key=lambda k: [int(i) if i.isdigit() else 0 for i in k.split(':')])
+        cls._nodes, cls._children, cls._version = nodes, children, version
+
+    @classmethod
+    def refresh(cls):
+        version = cls.get_version()
+        if version == cls._version:
+            return
+        with cls._lock:
+            if version != cls._version:
+                cls.load(version)
+
+    @classmethod
+    def get_node(cls, key):
+        cls.refresh()
+        node = cls._nodes.get(key)
+        return copy.copy(node) if node else None
+
+    @classmethod
+    def get_children_keys(cls, key, all_children=False):
+        cls.refresh()
+        keys = list(cls._children.get(key, []))
+        if not all_children:
+            return keys
+        all_keys = []
+        while keys:
+            k = keys.pop(0)
+            all_keys.append(k)
+            keys.extend(cls._children.get(k, []))
+        return all_keys
+
+    @classmethod
+    def get_children(cls, key, all_children=False):
+        keys = cls.get_children_keys(key, all_children=all_children)
+        nodes = cls._nodes
+        return [copy.copy(nodes[k]) for k in keys if k in nodes]
+
+    @classmethod
+    def get_nodes(cls, keys):
+        cls.refresh()
+        nodes = cls._nodes
+        return [copy.copy(nodes[k]) for k in keys if k in nodes]
 
 
 class Node(models.Model):
@@ -25,36 +109,68 @@ class Node(models.Model):
 
     @property
     def full_value(self):
-        if self == self.__class__.root():
-            return self.value
-        else:
-            return '{}/{}'.format(self.value, self.parent.full_value)
+        return '/'.join([node.value for node in self.ancestor_with_node])
 
     @property
     def level(self):
         return len(self.key.split(':'))
 
+    def get_next_children_keys(self, count=1):
+        """
+        Allocate count child keys, using an atomic update so concurrent
+        allocation never get the same key, and not save the whole row
+        """
+        queryset = self.__class__.objects.filter(pk=self.pk)
+        with transaction.atomic():
+            queryset.update(child_mark=F('child_mark') + count)
+            self.child_mark = queryset.values_list('child_mark', flat=True)[0]
+        start = self.child_mark - count
+        return ["{}:{}".format(self.key, mark) for mark in range(start, self.child_mark)]
+
     def get_next_child_key(self):
-        mark = self.child_mark
-        self.child_mark += 1
-        self.save()
-        return "{}:{}".format(self.key, mark)
+        return self.get_next_children_keys(1)[0]
 
     def create_child(self, value):
         child_key = self.get_next_child_key()
         child = self.__class__.objects.create(key=child_key, value=value)
         return child
 
+    def create_children(self, values):
+        """
+        Bulk create children, keys are allocated in one statement
+        """
+        keys = self.get_next_children_keys(len(values))
+        children = [
+            self.__class__(key=key, value=value)
+            for key, value in zip(keys, values)
+        ]
+        children = self.__class__.objects.bulk_create(children)
+        # Bulk create not send post_save signal
+        transaction.on_commit(NodeTree.expire)
+        return children
+
+    @property
+    def children_key_prefix(self):
+        return '{}:'.format(self.key)
+
     def get_children(self):
-        return self.__class__.objects.filter(key__regex=r'{}:[0-9]+$'.format(self.key))
+        # Prefix filter using key index, regex only check the rest
+        return self.__class__.objects.filter(
+            key__startswith=self.children_key_prefix,
+            key__regex=r'^{}:[0-9]+$'.format(self.key),
+        )
 
     def get_all_children(self):
-        return self.__class__.objects.filter(key__startswith='{}:'.format(self.key))
+        return self.__class__.objects.filter(key__startswith=self.children_key_prefix)
+
+    @property
+    def family_filter(self):
+        return Q(key=self.key) | Q(key__startswith=self.children_key_prefix)
 
     def get_family(self):
-        children = list(self.get_all_children())
-        children.append(self)
-        return children
+        family = NodeTree.get_children(self.key, all_children=True)
+        family.append(self)
+        return family
 
     def get_assets(self):
         from .asset import Asset
@@ -69,8 +185,10 @@ class Node(models.Model):
         if self.is_root():
             assets = Asset.objects.all()
         else:
-            nodes = self.get_family()
-            assets = Asset.objects.filter(nodes__in=nodes)
+            assets = Asset.objects.filter(
+                Q(nodes__key=self.key) |
+                Q(nodes__key__startswith=self.children_key_prefix)
+            ).distinct()
         return assets
 
     def get_all_active_assets(self):
@@ -80,39 +198,93 @@ class Node(models.Model):
         return self.key == '0'
 
     @property
-    def parent(self):
-        if self.key == "0":
-            return self.__class__.root()
-        elif not self.key.startswith("0"):
-            return self.__class__.root()
+    def parent_key(self):
+        if self.key == "0" or not self.key.startswith("0"):
+            return "0"
+        return ":".join(self.key.split(":")[:-1])
 
-        parent_key = ":".join(self.key.split(":")[:-1])
-        try:
-            parent = self.__class__.objects.get(key=parent_key)
-        except Node.DoesNotExist:
+    @property
+    def parent(self):
+        if self.is_root():
+            return self
+        parent = NodeTree.get_node(self.parent_key)
+        if parent is None:
             return self.__class__.root()
-        else:
-            return parent
+        return parent
 
     @parent.setter
     def parent(self, parent):
+        # Only set the key, saved by `save`, use `move_to` with subtree
         self.key = parent.get_next_child_key()
 
+    def is_ancestor_of(self, node):
+        return node.key.startswith(self.children_key_prefix)
+
+    def move_to(self, parent):
+        """
+        Move node with the whole subtree under parent, the key prefix of
+        all nodes in subtree rewrite in one update statement. Keys of the
+        node and parent are read again locked, they may be changed by an
+        earlier move of the same batch
+        """
+        model = self.__class__
+        with transaction.atomic():
+            self.key = model.objects.select_for_update().get(pk=self.pk).key
+            parent.key = model.objects.select_for_update().get(pk=parent.pk).key
+            if self.is_root():
+                raise ValueError("Root node can't be moved")
+            if parent.key == self.key or self.is_ancestor_of(parent):
+                raise ValueError("Can't move node under itself or its children")
+
+            old_key = self.key
+            new_key = parent.get_next_child_key()
+            model.objects.filter(self.family_filter).update(
+                key=Concat(Value(new_key), Substr('key', len(old_key) + 1))
+            )
+        self.key = new_key
+        # Update not send post_save signal
+        transaction.on_commit(NodeTree.expire)
+        on_node_moved.send(model, node=self, old_key=old_key, new_key=new_key)
+
+    def get_ancestor_keys(self, with_self=False):
+        """
+        :return: Ancestor keys from parent to root, like ['0:1', '0']
+        """
+        parts = self.key.split(':')
+        keys = [':'.join(parts[:i]) for i in range(len(parts)-1, 0, -1)]
+        if with_self:
+            keys.insert(0, self.key)
+        if not keys or keys[-1] != '0':
+            keys.append('0')
+        return keys
+
+    def get_ancestor(self, with_self=False):
+        """
+        Get ancestor from node tree cache
+        :return: [parent, .., root]
+        """
+        if self.is_root():
+            return [self]
+        ancestor = NodeTree.get_nodes(self.get_ancestor_keys())
+        if not ancestor or not ancestor[-1].is_root():
+            ancestor.append(self.__class__.root())
+        if with_self:
+            ancestor.insert(0, self)
+        return ancestor
+
     @property
     def ancestor(self):
-        if self.parent == self.__class__.root():
-            return [self.__class__.root()]
-        else:
-            return [self.parent, *tuple(self.parent.ancestor)]
+        return self.get_ancestor()
 
     @property
     def ancestor_with_node(self):
-        ancestor = self.ancestor
-        ancestor.insert(0, self)
-        return ancestor
+        return self.get_ancestor(with_self=True)
 
     @classmethod
     def root(cls):
+        obj = NodeTree.get_node('0')
+        if obj:
+            return obj
         obj, created = cls.objects.get_or_create(
             key='0', defaults={"key": '0', 'value': "ROOT"}
         )
@@ -3,7 +3,9 @@
 #
 
 import os
+import glob
 import logging
+import threading
 import uuid
 from hashlib import md5
 
@@ -23,6 +25,79 @@ logger = logging.getLogger(__name__)
 signer = get_signer()
 
 
+class PrivateKeyFileManager:
+    """
+    Materialize private key of asset user to file for ansible. The path of
+    (user id, key version) is kept in memory, so a key is parsed and
+    written once in a process. Key version is the hash of the signed key,
+    so getting it need no unsign.
+    """
+    def __init__(self):
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    @property
+    def key_dir(self):
+        return os.path.join(settings.PROJECT_DIR, 'tmp')
+
+    @staticmethod
+    def get_key_version(user):
+        return md5(user._private_key.encode('utf-8')).hexdigest()
+
+    def get_key_path(self, user, version):
+        return os.path.join(self.key_dir, '.{}-{}'.format(user.id, version))
+
+    @staticmethod
+    def write_key_file(key_obj, path):
+        tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        key_obj.write_private_key_file(tmp_path)
+        os.chmod(tmp_path, 0o400)
+        os.rename(tmp_path, path)
+
+    def get_file(self, user):
+        if not user._private_key:
+            return None
+        version = self.get_key_version(user)
+        key = (str(user.id), version)
+        path = self._paths.get(key)
+        if path and os.path.exists(path):
+            return path
+
+        path = self.get_key_path(user, version)
+        if not os.path.exists(path):
+            key_obj = user.private_key_obj
+            if not key_obj:
+                return None
+            self.write_key_file(key_obj, path)
+        with self._lock:
+            self._paths[key] = path
+        return path
+
+    def clean(self, user):
+        """
+        Remove key files of the user except the current version
+        """
+        user_id = str(user.id)
+        current = None
+        if user._private_key:
+            current = self.get_key_path(user, self.get_key_version(user))
+        with self._lock:
+            for key in [k for k in self._paths if k[0] == user_id]:
+                if self._paths[key] != current:
+                    self._paths.pop(key)
+        pattern = os.path.join(self.key_dir, '.{}-*'.format(user_id))
+        for path in glob.glob(pattern):
+            if path == current:
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error("Remove key file {} failed: {}".format(path, e))
+
+
+private_key_file_manager = PrivateKeyFileManager()
+
+
 class AssetUser(models.Model):
     id = models.UUIDField(default=uuid.uuid4, primary_key=True)
     name = models.CharField(max_length=128, unique=True, verbose_name=_('Name'))
@@ -67,17 +142,7 @@ class AssetUser(models.Model):
 
     @property
     def private_key_file(self):
-        if not self.private_key_obj:
-            return None
-        project_dir = settings.PROJECT_DIR
-        tmp_dir = os.path.join(project_dir, 'tmp')
-        key_str = signer.unsign(self._private_key)
-        key_name = '.' + md5(key_str.encode('utf-8')).hexdigest()
-        key_path = os.path.join(tmp_dir, key_name)
-        if not os.path.exists(key_path):
-            self.private_key_obj.write_private_key_file(key_path)
-            os.chmod(key_path, 0o400)
-        return key_path
+        return private_key_file_manager.get_file(self)
 
     @property
     def public_key(self):
@@ -110,6 +175,8 @@ class AssetUser(models.Model):
 
         if update_fields:
             self.save(update_fields=update_fields)
+        if private_key:
+            private_key_file_manager.clean(self)
 
     def auto_gen_auth(self):
         password = str(uuid.uuid4())
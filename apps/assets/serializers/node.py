@@ -4,6 +4,7 @@ from rest_framework_bulk.serializers import BulkListSerializer
 
 from common.mixins import BulkSerializerMixin
 from ..models import Asset, Node
+from ..utils import get_nodes_assets_amount
 from .asset import AssetGrantedSerializer
 
 
@@ -49,9 +50,16 @@ class NodeSerializer(serializers.ModelSerializer):
     def get_parent(obj):
         return obj.parent.id
 
-    @staticmethod
-    def get_assets_amount(obj):
-        return obj.get_all_assets().count()
+    def get_nodes_assets_amount(self):
+        # Load once for all nodes of the request
+        amount = self.context.get('nodes_assets_amount')
+        if amount is None:
+            amount = self.context['nodes_assets_amount'] = get_nodes_assets_amount()
+        return amount
+
+    def get_assets_amount(self, obj):
+        amount = self.get_nodes_assets_amount().get(obj.key)
+        return amount["total"] if amount else 0
 
     def get_fields(self):
         fields = super().get_fields()
@@ -3,3 +3,4 @@
 from django.dispatch import Signal
 
 on_app_ready = Signal()
+on_node_moved = Signal(providing_args=["node", "old_key", "new_key"])
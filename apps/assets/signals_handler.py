@@ -1,41 +1,37 @@
 # -*- coding: utf-8 -*-
 #
 
-from django.db.models.signals import post_save, m2m_changed
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
+from django.db import transaction
 
 from common.utils import get_logger
-from .models import Asset, SystemUser, Node
-from .tasks import update_assets_hardware_info_util, \
-    test_asset_connectability_util, push_system_user_to_node, \
-    push_node_system_users_to_asset
+from .models import Asset, SystemUser, AdminUser, Node, NodeTree
+from .utils import expire_nodes_assets_amount, add_created_assets, \
+    expire_inventory, expire_assets_hardware_hash
+from .tasks import push_system_user_to_node, push_node_system_users_to_asset
 
 
 logger = get_logger(__file__)
 
 
-def update_asset_hardware_info_on_created(asset):
-    logger.debug("Update asset `{}` hardware info".format(asset))
-    update_assets_hardware_info_util.delay([asset])
-
-
-def test_asset_conn_on_created(asset):
-    logger.debug("Test asset `{}` connectability".format(asset))
-    test_asset_connectability_util.delay([asset])
-
-
 def set_asset_root_node(asset):
-    logger.debug("Set asset default node: {}".format(Node.root()))
-    asset.nodes.add(Node.root())
+    root = Node.root()
+    logger.debug("Set asset default node: {}".format(root))
+    asset.nodes.add(root)
 
 
 @receiver(post_save, sender=Asset, dispatch_uid="my_unique_identifier")
 def on_asset_created_or_update(sender, instance=None, created=False, **kwargs):
-    set_asset_root_node(instance)
     if created:
         logger.info("Asset `{}` create signal received".format(instance))
-        update_asset_hardware_info_on_created(instance)
-        test_asset_conn_on_created(instance)
+        set_asset_root_node(instance)
+        asset_id = instance.id
+        # Queue after commit, the period task may run before it committed
+        transaction.on_commit(lambda: add_created_assets([asset_id]))
+    elif not instance.nodes.exists():
+        # Asset of no node is not in the tree, put it under root
+        set_asset_root_node(instance)
 
 
 @receiver(post_save, sender=SystemUser, dispatch_uid="my_unique_identifier")
@@ -69,3 +65,36 @@ def on_node_assets_changed(sender, instance=None, **kwargs):
         assets = kwargs['model'].objects.filter(pk__in=kwargs['pk_set'])
         push_node_system_users_to_asset(instance, assets)
 
+
+
+@receiver(post_save, sender=Node)
+@receiver(post_delete, sender=Node)
+def on_node_changed(sender, instance=None, **kwargs):
+    logger.debug("Node `{}` changed, expire node tree".format(instance))
+    # Expire after commit, or other process may reload the old tree
+    transaction.on_commit(NodeTree.expire)
+
+
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+@receiver(m2m_changed, sender=Asset.nodes.through)
+def on_asset_changed_expire_nodes_amount(sender, **kwargs):
+    transaction.on_commit(expire_nodes_assets_amount)
+
+
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+def on_asset_changed_expire_hardware_hash(sender, instance=None, **kwargs):
+    hostname = instance.hostname
+    transaction.on_commit(lambda: expire_assets_hardware_hash([hostname]))
+
+
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+@receiver(post_save, sender=AdminUser)
+@receiver(post_delete, sender=AdminUser)
+@receiver(post_save, sender=SystemUser)
+@receiver(post_delete, sender=SystemUser)
+@receiver(m2m_changed, sender=Asset.nodes.through)
+def on_asset_auth_changed_expire_inventory(sender, **kwargs):
+    transaction.on_commit(expire_inventory)
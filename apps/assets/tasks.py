@@ -2,17 +2,19 @@
 import json
 import re
 import os
+import time
+from hashlib import md5
 
 from celery import shared_task
 from django.core.cache import cache
 from django.utils.translation import ugettext as _
 
-from common.utils import get_object_or_none, capacity_convert, \
-    sum_capacity, encrypt_password, get_logger
+from common.utils import capacity_convert, \
+    sum_capacity, encrypt_password, get_logger, bulk_update_objects
 from common.celery import register_as_period_task, after_app_shutdown_clean, \
     after_app_ready_start, app as celery_app
 
-from .models import SystemUser, AdminUser, Asset, Cluster
+from .models import SystemUser, AdminUser, Asset, Cluster, Node
 from . import const
 
 
@@ -20,10 +22,45 @@ FORKS = 10
 TIMEOUT = 60
 logger = get_logger(__file__)
 CACHE_MAX_TIME = 60*60*60
+HARDWARE_CHUNK_SIZE = 500
 disk_pattern = re.compile(r'^hd|sd|xvd|vd')
 PERIOD_TASK = os.environ.get("PERIOD_TASK", "on")
 
 
+def get_hardware_info_from_facts(info):
+    """
+    Get the asset hardware fields value from ansible setup facts
+    """
+    ___vendor = info.get('ansible_system_vendor', 'Unknown')
+    ___model = info.get('ansible_product_name', 'Unknown')
+    ___sn = info.get('ansible_product_serial', 'Unknown')
+
+    for ___cpu_model in info.get('ansible_processor', []):
+        if ___cpu_model.endswith('GHz') or ___cpu_model.startswith("Intel"):
+            break
+    else:
+        ___cpu_model = 'Unknown'
+    ___cpu_model = ___cpu_model[:64]
+    ___cpu_count = info.get('ansible_processor_count', 0)
+    ___cpu_cores = info.get('ansible_processor_cores', None) or len(info.get('ansible_processor', []))
+    ___memory = '%s %s' % capacity_convert('{} MB'.format(info.get('ansible_memtotal_mb')))
+    disk_info = {}
+    for dev, dev_info in info.get('ansible_devices', {}).items():
+        if disk_pattern.match(dev) and dev_info['removable'] == '0':
+            disk_info[dev] = dev_info['size']
+    ___disk_total = '%s %s' % sum_capacity(disk_info.values())
+    ___disk_info = json.dumps(disk_info, sort_keys=True)
+
+    ___platform = info.get('ansible_system', 'Unknown')
+    ___os = info.get('ansible_distribution', 'Unknown')
+    ___os_version = info.get('ansible_distribution_version', 'Unknown')
+    ___os_arch = info.get('ansible_architecture', 'Unknown')
+    ___hostname_raw = info.get('ansible_hostname', 'Unknown')
+
+    values = dict(locals())
+    return {k.strip('_'): v for k, v in values.items() if k.startswith('___')}
+
+
 @shared_task
 def set_assets_hardware_info(result, **kwargs):
     """
@@ -31,53 +68,77 @@ def set_assets_hardware_info(result, **kwargs):
 
     @shared_task must be exit, because we using it as a task callback, is must
     be a celery task also
+
+    Hash of the hardware info is cached, asset which facts not changed is
+    passed, others are got using one query and updated in chunks. The hash
+    is expired when the asset saved, so edited hardware info is set again
     :param result:
     :param kwargs: {task_name: ""}
     :return:
     """
+    time_start = time.time()
     result_raw = result[0]
-    assets_updated = []
+    hosts_info = {}
     for hostname, info in result_raw.get('ok', {}).items():
         info = info.get('setup', {}).get('ansible_facts', {})
         if not info:
             logger.error("Get asset info failed: {}".format(hostname))
             continue
+        hosts_info[hostname] = get_hardware_info_from_facts(info)
+
+    hashes_key = {
+        hostname: const.ASSET_HARDWARE_HASH_CACHE_KEY.format(hostname)
+        for hostname in hosts_info
+    }
+    hashes_cached = cache.get_many(list(hashes_key.values()))
+    hashes_changed = {}
+    for hostname, hardware in hosts_info.items():
+        hardware_hash = md5(
+            json.dumps(hardware, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        if hashes_cached.get(hashes_key[hostname]) != hardware_hash:
+            hashes_changed[hostname] = hardware_hash
+    time_parsed = time.time()
+
+    assets = []
+    hostname_list = list(hashes_changed.keys())
+    for i in range(0, len(hostname_list), HARDWARE_CHUNK_SIZE):
+        assets.extend(Asset.objects.filter(
+            hostname__in=hostname_list[i:i + HARDWARE_CHUNK_SIZE]
+        ))
+    time_resolved = time.time()
 
-        asset = get_object_or_none(Asset, hostname=hostname)
-        if not asset:
-            continue
-
-        ___vendor = info.get('ansible_system_vendor', 'Unknown')
-        ___model = info.get('ansible_product_name', 'Unknown')
-        ___sn = info.get('ansible_product_serial', 'Unknown')
-
-        for ___cpu_model in info.get('ansible_processor', []):
-            if ___cpu_model.endswith('GHz') or ___cpu_model.startswith("Intel"):
-                break
-        else:
-            ___cpu_model = 'Unknown'
-        ___cpu_model = ___cpu_model[:64]
-        ___cpu_count = info.get('ansible_processor_count', 0)
-        ___cpu_cores = info.get('ansible_processor_cores', None) or len(info.get('ansible_processor', []))
-        ___memory = '%s %s' % capacity_convert('{} MB'.format(info.get('ansible_memtotal_mb')))
-        disk_info = {}
-        for dev, dev_info in info.get('ansible_devices', {}).items():
-            if disk_pattern.match(dev) and dev_info['removable'] == '0':
-                disk_info[dev] = dev_info['size']
-        ___disk_total = '%s %s' % sum_capacity(disk_info.values())
-        ___disk_info = json.dumps(disk_info)
-
-        ___platform = info.get('ansible_system', 'Unknown')
-        ___os = info.get('ansible_distribution', 'Unknown')
-        ___os_version = info.get('ansible_distribution_version', 'Unknown')
-        ___os_arch = info.get('ansible_architecture', 'Unknown')
-        ___hostname_raw = info.get('ansible_hostname', 'Unknown')
-
-        for k, v in locals().items():
-            if k.startswith('___'):
-                setattr(asset, k.strip('_'), v)
-        asset.save()
-        assets_updated.append(asset)
+    assets_updated = []
+    fields_updated = set()
+    for asset in assets:
+        hardware = hosts_info[asset.hostname]
+        fields_changed = [
+            k for k, v in hardware.items() if getattr(asset, k) != v
+        ]
+        for k in fields_changed:
+            setattr(asset, k, hardware[k])
+        if fields_changed:
+            assets_updated.append(asset)
+            fields_updated.update(fields_changed)
+
+    for i in range(0, len(assets_updated), HARDWARE_CHUNK_SIZE):
+        bulk_update_objects(
+            assets_updated[i:i + HARDWARE_CHUNK_SIZE], list(fields_updated)
+        )
+    cache.set_many({
+        hashes_key[asset.hostname]: hashes_changed[asset.hostname]
+        for asset in assets
+    }, CACHE_MAX_TIME)
+    time_finished = time.time()
+
+    logger.info(
+        "Set assets hardware info: {} hosts, {} changed, {} updated; "
+        "parse {:.2f}s, resolve {:.2f}s, update {:.2f}s".format(
+            len(hosts_info), len(hashes_changed), len(assets_updated),
+            time_parsed - time_start, time_resolved - time_parsed,
+            time_finished - time_resolved,
+        )
+    )
     return assets_updated
 
 
@@ -106,6 +167,99 @@ def update_assets_hardware_info_util(assets, task_name=None):
     return result
 
 
+@shared_task
+def update_assets_info_on_created(assets_id):
+    """
+    Update hardware info and test connectability of new assets, one
+    ansible run each for all of them
+    """
+    assets = list(Asset.objects.filter(id__in=assets_id))
+    if not assets:
+        return
+    # task_name = _("Update created assets hardware info")
+    task_name = _("更新新建资产硬件信息")
+    update_assets_hardware_info_util(assets, task_name=task_name)
+    # task_name = _("Test created assets connectability")
+    task_name = _("测试新建资产可连接性")
+    test_asset_connectability_util(assets, task_name=task_name)
+
+
+@shared_task
+@register_as_period_task(interval=30)
+@after_app_ready_start
+@after_app_shutdown_clean
+def update_created_assets_info_period():
+    from .utils import pop_created_assets
+    assets_id = pop_created_assets()
+    if assets_id:
+        logger.debug("Update {} created assets info".format(len(assets_id)))
+        update_assets_info_on_created(assets_id)
+
+
+@shared_task
+def refresh_updated_assets_info(assets_id, refresh_assets_id):
+    """
+    Bulk updated assets don't send any signal, so do what their save signal
+    does: make sure they are in the root node, rebuild their grants, expire
+    their hardware hash, and update hardware info and test connectability
+    of the ones whose admin user or activity changed
+    """
+    from .hands import AssetGrantIndex
+    from .utils import expire_nodes_assets_amount, expire_assets_hardware_hash
+
+    root = Node.root()
+    through = Asset.nodes.through
+    in_root = set(
+        through.objects.filter(asset_id__in=assets_id, node_id=root.id)
+        .values_list('asset_id', flat=True)
+    )
+    missing = [i for i in assets_id if i not in in_root]
+    through.objects.bulk_create([
+        through(asset_id=i, node_id=root.id) for i in missing
+    ])
+    AssetGrantIndex.rebuild_assets(assets_id)
+    expire_assets_hardware_hash(
+        Asset.objects.filter(id__in=assets_id).values_list('hostname', flat=True)
+    )
+    if missing:
+        expire_nodes_assets_amount()
+        push_node_system_users_to_asset(
+            root, list(Asset.objects.filter(id__in=missing))
+        )
+
+    assets = list(Asset.objects.filter(id__in=refresh_assets_id))
+    if not assets:
+        return
+    # task_name = _("Update imported assets hardware info")
+    task_name = _("更新导入资产硬件信息")
+    update_assets_hardware_info_util(assets, task_name=task_name)
+    # task_name = _("Test imported assets connectability")
+    task_name = _("测试导入资产可连接性")
+    test_asset_connectability_util(assets, task_name=task_name)
+
+
+@shared_task
+def update_imported_assets_info(assets_id):
+    """
+    Bulk imported assets don't send any signal, so do the same things of
+    the asset created signal once for all of them: rebuild the grants, push
+    the root node system users, update hardware info and test connectability
+    """
+    from .hands import AssetGrantIndex
+
+    AssetGrantIndex.rebuild_assets(assets_id)
+    assets = list(Asset.objects.filter(id__in=assets_id))
+    if not assets:
+        return
+    push_node_system_users_to_asset(Node.root(), assets)
+    # task_name = _("Update imported assets hardware info")
+    task_name = _("更新导入资产硬件信息")
+    update_assets_hardware_info_util(assets, task_name=task_name)
+    # task_name = _("Test imported assets connectability")
+    task_name = _("测试导入资产可连接性")
+    test_asset_connectability_util(assets, task_name=task_name)
+
+
 @shared_task
 def update_asset_hardware_info_manual(asset):
     # task_name = _("Update asset hardware info")
@@ -156,25 +310,28 @@ def set_admin_user_connectability_info(result, **kwargs):
     cache_key = const.ADMIN_USER_CONN_CACHE_KEY.format(admin_user)
     cache.set(cache_key, summary, CACHE_MAX_TIME)
 
-    for i in summary.get('contacted', []):
-        asset_conn_cache_key = const.ASSET_ADMIN_CONN_CACHE_KEY.format(i)
-        cache.set(asset_conn_cache_key, 1, CACHE_MAX_TIME)
+    cache.set_many({
+        const.ASSET_ADMIN_CONN_CACHE_KEY.format(i): 1
+        for i in summary.get('contacted', [])
+    }, CACHE_MAX_TIME)
 
-    for i, msg in summary.get('dark', {}).items():
-        asset_conn_cache_key = const.ASSET_ADMIN_CONN_CACHE_KEY.format(i)
-        cache.set(asset_conn_cache_key, 0, CACHE_MAX_TIME)
+    dark = summary.get('dark', {})
+    cache.set_many({
+        const.ASSET_ADMIN_CONN_CACHE_KEY.format(i): 0 for i in dark
+    }, CACHE_MAX_TIME)
+    for i, msg in dark.items():
         logger.error(msg)
 
 
 @shared_task
 def test_admin_user_connectability_util(admin_user, task_name):
     """
-    Test asset admin user can connect or not. Using ansible api do that
+    Test asset admin user can connect or not. Using ssh prober do that
     :param admin_user:
     :param task_name:
     :return:
     """
-    from ops.utils import update_or_create_ansible_task
+    from ops.utils import run_probe_task
 
     assets = admin_user.get_related_assets()
     hosts = [asset.hostname for asset in assets
@@ -182,11 +339,9 @@ def test_admin_user_connectability_util(admin_user, task_name):
     if not hosts:
         return
     tasks = const.TEST_ADMIN_USER_CONN_TASKS
-    task, created = update_or_create_ansible_task(
-        task_name=task_name, hosts=hosts, tasks=tasks, pattern='all',
-        options=const.TASK_OPTIONS, run_as_admin=True, created_by='System',
+    result = run_probe_task(
+        task_name, hosts, tasks, options=const.TASK_OPTIONS, run_as_admin=True,
     )
-    result = task.run()
     set_admin_user_connectability_info(result, admin_user=admin_user.name)
     return result
 
@@ -219,7 +374,7 @@ def test_admin_user_connectability_manual(admin_user):
 
 @shared_task
 def test_asset_connectability_util(assets, task_name=None):
-    from ops.utils import update_or_create_ansible_task
+    from ops.utils import run_probe_task
 
     if task_name is None:
         # task_name = _("Test assets connectability")
@@ -229,17 +384,17 @@ def test_asset_connectability_util(assets, task_name=None):
         logger.info("No hosts, passed")
         return {}
     tasks = const.TEST_ADMIN_USER_CONN_TASKS
-    task, created = update_or_create_ansible_task(
-        task_name=task_name, hosts=hosts, tasks=tasks, pattern='all',
-        options=const.TASK_OPTIONS, run_as_admin=True, created_by='System',
+    raw, summary = run_probe_task(
+        task_name, hosts, tasks, options=const.TASK_OPTIONS, run_as_admin=True,
     )
-    result = task.run()
-    summary = result[1]
-    for k in summary.get('dark'):
-        cache.set(const.ASSET_ADMIN_CONN_CACHE_KEY.format(k), 0, CACHE_MAX_TIME)
-
-    for k in summary.get('contacted'):
-        cache.set(const.ASSET_ADMIN_CONN_CACHE_KEY.format(k), 1, CACHE_MAX_TIME)
+    cache.set_many({
+        const.ASSET_ADMIN_CONN_CACHE_KEY.format(k): 0
+        for k in summary.get('dark')
+    }, CACHE_MAX_TIME)
+    cache.set_many({
+        const.ASSET_ADMIN_CONN_CACHE_KEY.format(k): 1
+        for k in summary.get('contacted')
+    }, CACHE_MAX_TIME)
     return summary
 
 
@@ -274,19 +429,18 @@ def test_system_user_connectability_util(system_user, task_name):
     :param task_name:
     :return:
     """
-    from ops.utils import update_or_create_ansible_task
+    from ops.utils import run_probe_task
+
     assets = system_user.assets
     hosts = [asset.hostname for asset in assets if asset.is_active and asset.is_unixlike()]
-    tasks = const.TEST_SYSTEM_USER_CONN_TASKS
     if not hosts:
         logger.info("No hosts, passed")
         return {}
-    task, created = update_or_create_ansible_task(
-        task_name, hosts=hosts, tasks=tasks, pattern='all',
-        options=const.TASK_OPTIONS,
-        run_as=system_user.name, created_by="System",
+    tasks = const.TEST_SYSTEM_USER_CONN_TASKS
+    result = run_probe_task(
+        task_name, hosts, tasks, options=const.TASK_OPTIONS,
+        run_as=system_user.name,
     )
-    result = task.run()
     set_system_user_connectablity_info(result, system_user=system_user.name)
     return result
 
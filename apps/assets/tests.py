@@ -1,3 +1,160 @@
+from unittest import mock
+
 from django.test import TestCase
+from django.urls import reverse
+
+from .models import Node, NodeTree, Asset
+from .utils import AssetBulkImporter
+
+
+class NodeTestMixin:
+    def setUp(self):
+        self.root, _ = Node.objects.get_or_create(key='0', defaults={'value': 'ROOT'})
+        # Tree of the process may be loaded by other tests rolled back
+        NodeTree.expire()
+
+    def create_node(self, key, value=None):
+        return Node.objects.create(key=key, value=value or 'node{}'.format(key))
+
+
+class TestNodeKeyPath(NodeTestMixin, TestCase):
+    def test_ancestor_keys(self):
+        node = Node(key='0:1:2', value='node')
+        self.assertEqual(node.get_ancestor_keys(), ['0:1', '0'])
+        self.assertEqual(node.get_ancestor_keys(with_self=True), ['0:1:2', '0:1', '0'])
+        self.assertEqual(self.root.get_ancestor_keys(), ['0'])
+
+    def test_children_by_key_prefix(self):
+        node = self.create_node('0:1')
+        child = self.create_node('0:1:1')
+        grandchild = self.create_node('0:1:1:1')
+        # Key prefix '0:1' also matches '0:10', it's not a child
+        self.create_node('0:10')
+        self.assertEqual(list(node.get_children()), [child])
+        self.assertEqual(
+            set(node.get_all_children()), {child, grandchild}
+        )
+
+
+class TestNodeTree(NodeTestMixin, TestCase):
+    def test_reload_when_expired(self):
+        self.create_node('0:1')
+        self.create_node('0:1:2')
+        self.create_node('0:1:10')
+        NodeTree.expire()
+        # Children sorted by the number of key, not the string
+        self.assertEqual(NodeTree.get_children_keys('0:1'), ['0:1:2', '0:1:10'])
+        self.create_node('0:1:10:1')
+        NodeTree.expire()
+        self.assertEqual(
+            NodeTree.get_children_keys('0:1', all_children=True),
+            ['0:1:2', '0:1:10', '0:1:10:1'],
+        )
+
+    def test_nodes_copied(self):
+        self.create_node('0:1', value='node')
+        NodeTree.expire()
+        node = NodeTree.get_node('0:1')
+        node.value = 'changed'
+        self.assertEqual(NodeTree.get_node('0:1').value, 'node')
+
+
+class TestNodeChildrenKeys(NodeTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        from rest_framework.test import APIClient
+        from users.models import User
+        self.node = self.create_node('0:1')
+        user = User.objects.create(
+            username='admin', name='admin', email='', role=User.ROLE_ADMIN
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=user)
+        self.url = reverse('api-assets:node-children', kwargs={'pk': self.node.id})
+
+    def test_allocate_keys(self):
+        self.assertEqual(
+            self.node.get_next_children_keys(3), ['0:1:0', '0:1:1', '0:1:2']
+        )
+        self.assertEqual(self.node.get_next_child_key(), '0:1:3')
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.child_mark, 4)
+
+    def test_create_children(self):
+        children = self.node.create_children(['a', 'b'])
+        self.assertEqual([c.key for c in children], ['0:1:0', '0:1:1'])
+        self.assertEqual(
+            set(self.node.get_children().values_list('value', flat=True)),
+            {'a', 'b'},
+        )
+
+    def assert_bulk_rejected(self, values):
+        data = [{'value': value} for value in values]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, 400)
+        # No key allocated for the rejected request
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.child_mark, 0)
+
+    def test_bulk_create(self):
+        data = [{'value': 'a'}, {'value': 'b'}]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([n['key'] for n in response.data], ['0:1:0', '0:1:1'])
+
+    def test_bulk_create_invalid(self):
+        self.assert_bulk_rejected(['a', ''])
+        self.assert_bulk_rejected(['a', 'a'])
+        self.assert_bulk_rejected(['a', self.node.value])
+        self.assert_bulk_rejected(['a', 'x' * 129])
+
+
+class TestNodeMove(NodeTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.src = self.create_node('0:1')
+        self.child = self.create_node('0:1:0')
+        self.grandchild = self.create_node('0:1:0:0')
+        self.dst = self.create_node('0:2')
+
+    def test_move_subtree(self):
+        self.child.move_to(self.dst)
+        self.assertEqual(self.child.key, '0:2:0')
+        self.grandchild.refresh_from_db()
+        self.assertEqual(self.grandchild.key, '0:2:0:0')
+        self.assertFalse(self.src.get_all_children().exists())
+
+    def test_move_under_itself(self):
+        with self.assertRaises(ValueError):
+            self.src.move_to(self.grandchild)
+        with self.assertRaises(ValueError):
+            self.root.move_to(self.dst)
+        self.grandchild.refresh_from_db()
+        self.assertEqual(self.grandchild.key, '0:1:0:0')
+
+
+class TestAssetBulkImporter(NodeTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.asset = Asset.objects.create(hostname='host1', ip='10.0.0.1')
+
+    @mock.patch('assets.tasks.refresh_updated_assets_info.delay')
+    @mock.patch('assets.tasks.update_imported_assets_info.delay')
+    def test_import(self, update_imported, refresh_updated):
+        rows = [
+            {'id': str(self.asset.id), 'hostname': 'host1', 'ip': '10.0.0.1', 'port': '2222'},
+            {'id': '', 'hostname': 'host2', 'ip': '10.0.0.2', 'port': '22'},
+            {'id': '', 'hostname': 'host1', 'ip': '10.0.0.3', 'port': '22'},
+        ]
+        created, updated, failed = AssetBulkImporter(rows).run()
+        self.assertEqual(created, ['host2'])
+        self.assertEqual(updated, ['host1'])
+        self.assertEqual(len(failed), 1)
 
-# Create your tests here.
+        self.asset.refresh_from_db()
+        self.assertEqual(self.asset.port, 2222)
+        asset = Asset.objects.get(hostname='host2')
+        self.assertEqual(list(asset.nodes.all()), [self.root])
+        # Tasks start only when the import committed
+        update_imported.assert_not_called()
+        refresh_updated.assert_not_called()
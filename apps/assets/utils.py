@@ -4,10 +4,20 @@ from collections import defaultdict
 from functools import reduce
 import operator
 
+from django.db import transaction, IntegrityError
 from django.db.models import Q
+from django.core.cache import cache
+from django.utils.translation import ugettext as _
 
-from common.utils import get_object_or_none
-from .models import Asset, SystemUser, Label
+from common.utils import get_object_or_none, get_logger, is_uuid, \
+    bulk_update_objects, get_redis_client
+from .models import Asset, SystemUser, AdminUser, Label, Node, NodeTree
+from .const import NODES_ASSETS_AMOUNT_CACHE_KEY, \
+    ASSETS_INVENTORY_VERSION_CACHE_KEY, ASSETS_CREATED_QUEUE_KEY, \
+    ASSET_HARDWARE_HASH_CACHE_KEY
+
+
+logger = get_logger(__file__)
 
 
 def get_assets_by_id_list(id_list):
@@ -23,6 +33,95 @@ def get_system_user_by_name(name):
     return system_user
 
 
+def get_nodes_assets_amount(use_cache=True):
+    """
+    Count assets of every node using one query, asset in many nodes of
+    a subtree only count once
+    :return: {node_key: {"direct": 0, "total": 0, "active": 0}, ..}
+    """
+    cache_key = NODES_ASSETS_AMOUNT_CACHE_KEY.format(NodeTree.get_version())
+    if use_cache:
+        amount = cache.get(cache_key)
+        if amount is not None:
+            return amount
+
+    assets_keys = defaultdict(set)
+    assets_active = {}
+    ancestor_keys = {}
+    amount = defaultdict(lambda: {"direct": 0, "total": 0, "active": 0})
+    rows = Asset.nodes.through.objects.all()\
+        .values_list('asset_id', 'node__key', 'asset__is_active')
+    for asset_id, key, is_active in rows:
+        amount[key]["direct"] += 1
+        assets_active[asset_id] = is_active
+        if key not in ancestor_keys:
+            ancestor_keys[key] = Node(key=key).get_ancestor_keys(with_self=True)
+        assets_keys[asset_id].update(ancestor_keys[key])
+
+    for asset_id, keys in assets_keys.items():
+        is_active = assets_active[asset_id]
+        for key in keys:
+            amount[key]["total"] += 1
+            if is_active:
+                amount[key]["active"] += 1
+    # Root has all assets, including ones in no node
+    amount["0"]["total"] = Asset.objects.all().count()
+    amount["0"]["active"] = Asset.objects.filter(is_active=True).count()
+    amount = dict(amount)
+    cache.set(cache_key, amount, 3600)
+    return amount
+
+
+def expire_nodes_assets_amount():
+    cache.delete(NODES_ASSETS_AMOUNT_CACHE_KEY.format(NodeTree.get_version()))
+
+
+def get_inventory_version():
+    """
+    Version of assets and their auth info, with the node tree version,
+    inventory built with the same version is still valid
+    """
+    version = cache.get(ASSETS_INVENTORY_VERSION_CACHE_KEY, 0)
+    return version, NodeTree.get_version()
+
+
+def expire_inventory():
+    try:
+        cache.incr(ASSETS_INVENTORY_VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(ASSETS_INVENTORY_VERSION_CACHE_KEY, 1, None)
+
+
+def expire_assets_hardware_hash(hostname_list):
+    """
+    Hardware info of the assets may be edited, so facts not changed should
+    be set to them again
+    """
+    cache.delete_many([
+        ASSET_HARDWARE_HASH_CACHE_KEY.format(hostname)
+        for hostname in hostname_list
+    ])
+
+
+def add_created_assets(assets_id):
+    """
+    Created assets wait in a redis set, the period task update hardware
+    and test connectability of them together
+    """
+    if assets_id:
+        get_redis_client().sadd(
+            ASSETS_CREATED_QUEUE_KEY, *[str(i) for i in assets_id]
+        )
+
+
+def pop_created_assets():
+    pipe = get_redis_client().pipeline()
+    pipe.smembers(ASSETS_CREATED_QUEUE_KEY)
+    pipe.delete(ASSETS_CREATED_QUEUE_KEY)
+    assets_id, _ = pipe.execute()
+    return [i.decode('utf-8') for i in assets_id]
+
+
 class LabelFilter:
     def filter_queryset(self, queryset):
         queryset = super().filter_queryset(queryset)
@@ -44,5 +143,179 @@ class LabelFilter:
         return queryset
 
 
+class AssetBulkImporter:
+    """
+    Import assets rows in batches: lookups are resolved once for the whole
+    file, new assets are bulk created and changed assets updated with one
+    query per field and chunk, so no per row signal is sent. The side
+    effects of the signals are done once at the end by `finish`.
+
+    rows: [{"id": "", "hostname": "", "admin_user": "name", ..}, ..]
+    """
+    chunk_size = 500
+    int_fields = ('port', 'cpu_count', 'cpu_cores')
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.created = []
+        self.updated = []
+        self.failed = []
+        self.created_assets_id = []
+        self.updated_assets_id = []
+        # Updated assets changed admin user or activity, refresh them
+        self.refresh_assets_id = set()
+
+    @staticmethod
+    def chunks(items, size):
+        for i in range(0, len(items), size):
+            yield items[i:i + size]
+
+    def clean_row(self, row, admin_users):
+        for k, v in row.items():
+            if k == 'is_active':
+                v = True if v in ['TRUE', 1, 'true'] else False
+            elif k == 'admin_user':
+                v = admin_users.get(v)
+            elif k in self.int_fields:
+                try:
+                    v = int(v)
+                except ValueError:
+                    v = 0
+            else:
+                continue
+            row[k] = v
+        return row
+
+    def get_existing(self, rows):
+        assets_id = [row['id'] for row in rows if is_uuid(row.get('id') or '')]
+        hostnames = [row.get('hostname') for row in rows]
+
+        assets = {}
+        for chunk in self.chunks(assets_id, self.chunk_size):
+            assets.update(Asset.objects.in_bulk(chunk))
+        assets = {str(k): v for k, v in assets.items()}
+
+        hostnames_exist = set()
+        for chunk in self.chunks(hostnames, self.chunk_size):
+            hostnames_exist.update(
+                Asset.objects.filter(hostname__in=chunk)
+                .values_list('hostname', flat=True)
+            )
+        return assets, hostnames_exist
+
+    def split_rows(self):
+        admin_users = dict(AdminUser.objects.values_list('name', 'id'))
+        admin_users = {
+            name: AdminUser(id=pk, name=name) for name, pk in admin_users.items()
+        }
+        rows = [self.clean_row(row, admin_users) for row in self.rows]
+        assets, hostnames_exist = self.get_existing(rows)
+
+        to_create, to_update = [], []
+        for row in rows:
+            id_ = row.pop('id', None) or ''
+            asset = assets.get(id_.lower()) if is_uuid(id_) else None
+            if asset:
+                origin = (asset.admin_user_id, asset.is_active)
+                for k, v in row.items():
+                    if v:
+                        setattr(asset, k, v)
+                if (asset.admin_user_id, asset.is_active) != origin:
+                    self.refresh_assets_id.add(asset.id)
+                to_update.append(asset)
+                continue
+
+            hostname = row.get('hostname')
+            if hostname in hostnames_exist:
+                self.failed.append('%s: %s' % (hostname, _('already exists')))
+                continue
+            hostnames_exist.add(hostname)
+            to_create.append(Asset(**row))
+        return to_create, to_update
+
+    def create_assets(self, assets):
+        root = Node.root()
+        through = Asset.nodes.through
+        for chunk in self.chunks(assets, self.chunk_size):
+            try:
+                with transaction.atomic():
+                    Asset.objects.bulk_create(chunk)
+                    through.objects.bulk_create([
+                        through(asset_id=asset.id, node_id=root.id)
+                        for asset in chunk
+                    ])
+                    created = chunk
+            except Exception as e:
+                logger.debug("Bulk create assets failed, one by one: {}".format(e))
+                created = [asset for asset in chunk if self.create_asset(asset, root)]
+            self.created.extend([asset.hostname for asset in created])
+            self.created_assets_id.extend([asset.id for asset in created])
+
+    def create_asset(self, asset, root):
+        try:
+            with transaction.atomic():
+                Asset.objects.bulk_create([asset])
+                Asset.nodes.through.objects.create(asset_id=asset.id, node_id=root.id)
+        except Exception as e:
+            self.failed.append('%s: %s' % (asset.hostname, str(e)))
+            return False
+        return True
+
+    def update_assets(self, assets):
+        # Only the columns in the file may be changed
+        fields_name = {k for row in self.rows for k in row.keys()}
+        fields = [
+            field for field in Asset._meta.concrete_fields
+            if field.name in fields_name and not field.primary_key
+        ]
+        if not fields:
+            self.updated.extend([asset.hostname for asset in assets])
+            self.updated_assets_id.extend([asset.id for asset in assets])
+            return
+        for chunk in self.chunks(assets, self.chunk_size):
+            try:
+                with transaction.atomic():
+                    bulk_update_objects(chunk, [field.name for field in fields])
+                updated = chunk
+            except IntegrityError as e:
+                logger.debug("Bulk update assets failed, one by one: {}".format(e))
+                updated = [asset for asset in chunk if self.update_asset(asset, fields)]
+            self.updated.extend([asset.hostname for asset in updated])
+            self.updated_assets_id.extend([asset.id for asset in updated])
+
+    def update_asset(self, asset, fields):
+        values = {field.attname: getattr(asset, field.attname) for field in fields}
+        try:
+            with transaction.atomic():
+                Asset.objects.filter(pk=asset.pk).update(**values)
+        except IntegrityError as e:
+            self.failed.append('%s: %s' % (asset.hostname, str(e)))
+            return False
+        return True
+
+    def finish(self):
+        # The import runs in the request transaction, only expire caches
+        # and start tasks when it committed, or they see the old data
+        transaction.on_commit(self.on_commit)
 
+    def on_commit(self):
+        from .tasks import update_imported_assets_info, \
+            refresh_updated_assets_info
+        expire_nodes_assets_amount()
+        expire_inventory()
+        if self.created_assets_id:
+            update_imported_assets_info.delay(self.created_assets_id)
+        if self.updated_assets_id:
+            refresh_assets_id = [
+                i for i in self.updated_assets_id if i in self.refresh_assets_id
+            ]
+            refresh_updated_assets_info.delay(
+                self.updated_assets_id, refresh_assets_id
+            )
 
+    def run(self):
+        to_create, to_update = self.split_rows()
+        self.create_assets(to_create)
+        self.update_assets(to_update)
+        self.finish()
+        return self.created, self.updated, self.failed
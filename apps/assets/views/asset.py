@@ -14,7 +14,7 @@ from django.views.generic import TemplateView, ListView, View
 from django.views.generic.edit import CreateView, DeleteView, FormView, UpdateView
 from django.urls import reverse_lazy
 from django.views.generic.detail import DetailView
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.core.cache import cache
@@ -22,13 +22,15 @@ from django.utils import timezone
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import redirect
 from django.contrib.messages.views import SuccessMessageMixin
+from django.db.models import Q
 
 from common.mixins import JSONResponseMixin
-from common.utils import get_object_or_none, get_logger, is_uuid
+from common.utils import get_object_or_none, get_logger
 from common.const import create_success_msg, update_success_msg
 from .. import forms
 from ..models import Asset, AssetGroup, AdminUser, Cluster, SystemUser, Label, Node
 from ..hands import AdminUserRequiredMixin
+from ..utils import AssetBulkImporter
 
 
 __all__ = [
@@ -200,42 +202,116 @@ class AssetDetailView(DetailView):
         return super().get_context_data(**kwargs)
 
 
+class Echo:
+    """
+    A file-like object which just return the value to write, so csv writer
+    rows can be yielded to a streaming response
+    """
+    def write(self, value):
+        return value
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class AssetExportView(View):
-    def get(self, request):
-        spm = request.GET.get('spm', '')
-        assets_id_default = [Asset.objects.first().id] if Asset.objects.first() else []
-        assets_id = cache.get(spm, assets_id_default)
-        fields = [
+    chunk_size = 1000
+    spec_fields = ('assets_id', 'node_id', 'admin_user_id', 'search')
+
+    @staticmethod
+    def get_fields():
+        return [
             field for field in Asset._meta.fields
             if field.name not in [
                 'date_created'
             ]
         ]
+
+    @staticmethod
+    def filter_queryset(spec):
+        queryset = Asset.objects.all()
+        assets_id = spec.get('assets_id')
+        node_id = spec.get('node_id')
+        admin_user_id = spec.get('admin_user_id')
+        search = spec.get('search')
+
+        if assets_id:
+            return queryset.filter(id__in=assets_id)
+        if admin_user_id:
+            queryset = queryset.filter(admin_user_id=admin_user_id)
+        if node_id:
+            node = get_object_or_none(Node, id=node_id)
+            if node and not node.is_root():
+                assets_id = Asset.nodes.through.objects.filter(
+                    Q(node__key=node.key) |
+                    Q(node__key__startswith=node.children_key_prefix)
+                ).values('asset_id')
+                queryset = queryset.filter(id__in=assets_id)
+        if search:
+            queryset = queryset.filter(
+                Q(hostname__icontains=search) | Q(ip__icontains=search)
+            )
+        return queryset
+
+    def iter_rows(self, queryset, fields):
+        admin_users = dict(AdminUser.objects.values_list('id', 'name'))
+        attnames = [field.attname for field in fields]
+        yield [field.verbose_name for field in fields]
+
+        queryset = queryset.order_by('id').values_list('id', *attnames)
+
+        # Page by primary key, so every chunk is a bounded, indexed query
+        # whatever the db driver buffers
+        last_id = None
+        while True:
+            chunk = queryset.filter(id__gt=last_id) if last_id else queryset
+            values = list(chunk[:self.chunk_size])
+            if not values:
+                break
+            for value in values:
+                row = list(value[1:])
+                for i, field in enumerate(fields):
+                    if field.name == 'admin_user':
+                        row[i] = admin_users.get(row[i], '')
+                    elif row[i] is None:
+                        row[i] = ''
+                yield row
+            last_id = values[-1][0]
+
+    def iter_content(self, queryset, fields):
+        writer = csv.writer(Echo(), dialect='excel', quoting=csv.QUOTE_MINIMAL)
+        yield codecs.BOM_UTF8
+        for row in self.iter_rows(queryset, fields):
+            yield writer.writerow(row)
+
+    def get(self, request):
+        spm = request.GET.get('spm', '')
+        spec = cache.get(spm) if spm else None
+        if spec is None:
+            spec = {'assets_id': list(Asset.objects.values_list('id', flat=True)[:1])}
+        # Old clients cached the id list directly
+        elif isinstance(spec, list):
+            spec = {'assets_id': spec}
+
+        fields = self.get_fields()
+        queryset = self.filter_queryset(spec)
         filename = 'assets-{}.csv'.format(
             timezone.localtime(timezone.now()).strftime('%Y-%m-%d_%H-%M-%S')
         )
-        response = HttpResponse(content_type='text/csv')
+        response = StreamingHttpResponse(
+            self.iter_content(queryset, fields), content_type='text/csv'
+        )
         response['Content-Disposition'] = 'attachment; filename="%s"' % filename
-        response.write(codecs.BOM_UTF8)
-        assets = Asset.objects.filter(id__in=assets_id)
-        writer = csv.writer(response, dialect='excel', quoting=csv.QUOTE_MINIMAL)
-
-        header = [field.verbose_name for field in fields]
-        writer.writerow(header)
-
-        for asset in assets:
-            data = [getattr(asset, field.name) for field in fields]
-            writer.writerow(data)
         return response
 
     def post(self, request, *args, **kwargs):
         try:
-            assets_id = json.loads(request.body).get('assets_id', [])
+            data = json.loads(request.body)
         except ValueError:
             return HttpResponse('Json object not valid', status=400)
+        if not isinstance(data, dict):
+            return HttpResponse('Json object not valid', status=400)
+        spec = {k: data.get(k) for k in self.spec_fields if data.get(k)}
         spm = uuid.uuid4().hex
-        cache.set(spm, assets_id, 300)
+        cache.set(spm, spec, 300)
         url = reverse_lazy('assets:asset-export') + '?spm=%s' % spm
         return JsonResponse({'redirect': url})
 
@@ -267,47 +343,10 @@ class BulkImportAssetView(AdminUserRequiredMixin, JSONResponseMixin, FormView):
                            'template or export file'}
             return self.render_json_response(data)
 
-        created, updated, failed = [], [], []
-        assets = []
-        for row in csv_data[1:]:
-            if set(row) == {''}:
-                continue
-
-            asset_dict = dict(zip(attr, row))
-            id_ = asset_dict.pop('id', 0)
-            for k, v in asset_dict.items():
-                if k == 'is_active':
-                    v = True if v in ['TRUE', 1, 'true'] else False
-                elif k == 'admin_user':
-                    v = get_object_or_none(AdminUser, name=v)
-                elif k in ['port', 'cpu_count', 'cpu_cores']:
-                    try:
-                        v = int(v)
-                    except ValueError:
-                        v = 0
-                else:
-                    continue
-                asset_dict[k] = v
-
-            asset = get_object_or_none(Asset, id=id_) if is_uuid(id_) else None
-            if not asset:
-                try:
-                    if len(Asset.objects.filter(hostname=asset_dict.get('hostname'))):
-                        raise Exception(_('already exists'))
-                    asset = Asset.objects.create(**asset_dict)
-                    created.append(asset_dict['hostname'])
-                    assets.append(asset)
-                except Exception as e:
-                    failed.append('%s: %s' % (asset_dict['hostname'], str(e)))
-            else:
-                for k, v in asset_dict.items():
-                    if v:
-                        setattr(asset, k, v)
-                try:
-                    asset.save()
-                    updated.append(asset_dict['hostname'])
-                except Exception as e:
-                    failed.append('%s: %s' % (asset_dict['hostname'], str(e)))
+        rows = [
+            dict(zip(attr, row)) for row in csv_data[1:] if set(row) != {''}
+        ]
+        created, updated, failed = AssetBulkImporter(rows).run()
 
         data = {
             'created': created,
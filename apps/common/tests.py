@@ -1,3 +1,55 @@
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase
 
-# Create your tests here.
+from users.models import UserGroup
+from .utils import get_signer, bulk_update_objects
+
+
+class TestSignerUnsignMany(SimpleTestCase):
+    def setUp(self):
+        self.signer = get_signer()
+
+    def test_unsign_many(self):
+        values = [self.signer.sign('a'), self.signer.sign('b')]
+        self.assertEqual(self.signer.unsign_many(values), ['a', 'b'])
+
+    def test_bad_value_same_as_unsign(self):
+        values = ['bad', '', self.signer.sign('a')]
+        self.assertEqual(
+            self.signer.unsign_many(values),
+            [self.signer.unsign(v) for v in values],
+        )
+        self.assertEqual(self.signer.unsign_many(values)[:2], [{}, {}])
+
+
+class TestBulkUpdateObjects(TestCase):
+    def setUp(self):
+        self.groups = [
+            UserGroup.objects.create(name='group{}'.format(i), comment='')
+            for i in range(3)
+        ]
+
+    def test_update_fields(self):
+        for i, group in enumerate(self.groups[:2]):
+            group.name = 'renamed{}'.format(i)
+            group.comment = 'comment{}'.format(i)
+        rows = bulk_update_objects(self.groups[:2], ['name', 'comment'])
+        self.assertEqual(rows, 2)
+        for i, group in enumerate(self.groups[:2]):
+            group.refresh_from_db()
+            self.assertEqual(group.name, 'renamed{}'.format(i))
+            self.assertEqual(group.comment, 'comment{}'.format(i))
+        self.groups[2].refresh_from_db()
+        self.assertEqual(self.groups[2].name, 'group2')
+
+    def test_only_given_fields(self):
+        group = self.groups[0]
+        group.name = 'renamed'
+        group.comment = 'not saved'
+        bulk_update_objects([group], ['name'])
+        group.refresh_from_db()
+        self.assertEqual(group.name, 'renamed')
+        self.assertEqual(group.comment, '')
+
+    def test_empty(self):
+        self.assertEqual(bulk_update_objects([], ['name']), 0)
+        self.assertEqual(bulk_update_objects(self.groups, []), 0)
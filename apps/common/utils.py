@@ -63,26 +63,48 @@ class Signer(metaclass=Singleton):
     """用来加密,解密,和基于时间戳的方式验证token"""
     def __init__(self, secret_key=None):
         self.secret_key = secret_key
+        # Serializers keep nothing of a call, so they are reused
+        self._serializer = JSONWebSignatureSerializer(self.secret_key)
+        self._timed_serializers = {}
+
+    def get_timed_serializer(self, expires_in=None):
+        s = self._timed_serializers.get(expires_in)
+        if s is None:
+            s = TimedJSONWebSignatureSerializer(self.secret_key, expires_in=expires_in)
+            self._timed_serializers[expires_in] = s
+        return s
 
     def sign(self, value):
         if isinstance(value, bytes):
             value = value.decode("utf-8")
-        s = JSONWebSignatureSerializer(self.secret_key)
-        return s.dumps(value)
+        return self._serializer.dumps(value)
 
     def unsign(self, value):
-        s = JSONWebSignatureSerializer(self.secret_key)
         try:
-            return s.loads(value)
+            return self._serializer.loads(value)
         except BadSignature:
             return {}
 
+    def unsign_many(self, values):
+        """
+        Unsign a list of values, same as `unsign` every one, the bad one
+        get {}
+        """
+        loads = self._serializer.loads
+        results = []
+        for value in values:
+            try:
+                results.append(loads(value))
+            except BadSignature:
+                results.append({})
+        return results
+
     def sign_t(self, value, expires_in=3600):
-        s = TimedJSONWebSignatureSerializer(self.secret_key, expires_in=expires_in)
+        s = self.get_timed_serializer(expires_in)
         return str(s.dumps(value), encoding="utf8")
 
     def unsign_t(self, value):
-        s = TimedJSONWebSignatureSerializer(self.secret_key)
+        s = self.get_timed_serializer()
         try:
             return s.loads(value)
         except (BadSignature, SignatureExpired):
@@ -231,6 +253,47 @@ def setattr_bulk(seq, key, value):
     return map(set_attr, seq)
 
 
+def bulk_update_objects(objs, fields_name):
+    """
+    Update some fields of the objects using one query, Django 1.11 has no
+    bulk_update, so every field set with a `CASE WHEN pk`. Post save signal
+    isn't sent, callers should chunk objects by themselves
+    :param objs: objects of the same model
+    :param fields_name: field names to update
+    :return: rows updated
+    """
+    from django.db.models import Case, When, Value
+    if not objs or not fields_name:
+        return 0
+    model = objs[0].__class__
+    fields = [model._meta.get_field(name) for name in fields_name]
+    values = {
+        field.attname: Case(*[
+            When(pk=obj.pk, then=Value(
+                getattr(obj, field.attname), output_field=field
+            )) for obj in objs
+        ], output_field=field)
+        for field in fields
+    }
+    pks = [obj.pk for obj in objs]
+    return model.objects.filter(pk__in=pks).update(**values)
+
+
+_redis_client = None
+
+
+def get_redis_client():
+    """
+    Client of the cache redis db, for lists and sets the cache api has not
+    """
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        location = settings.CACHES['default']['LOCATION']
+        _redis_client = redis.StrictRedis.from_url(location)
+    return _redis_client
+
+
 def content_md5(data):
     """计算data的MD5值，经过Base64编码并返回str类型。
 
@@ -355,6 +355,42 @@ CELERY_REDIRECT_STDOUTS = True
 CELERY_REDIRECT_STDOUTS_LEVEL = "INFO"
 CELERY_WORKER_HIJACK_ROOT_LOGGER = False
 
+# Fleet wide ansible runs are split to shards, running as parallel celery
+# subtasks. Hosts per shard, max parallel subtasks of a run (more shards run
+# one after another in a subtask), max ansible forks of every shard (per
+# worker, tuned by the runner if not set), and a queue to route shards to
+# dedicated workers
+ANSIBLE_SHARD_SIZE = CONFIG.ANSIBLE_SHARD_SIZE or 200
+ANSIBLE_SHARD_MAX_PARALLEL = CONFIG.ANSIBLE_SHARD_MAX_PARALLEL or 8
+ANSIBLE_SHARD_FORKS = CONFIG.ANSIBLE_SHARD_FORKS or None
+ANSIBLE_SHARD_QUEUE = CONFIG.ANSIBLE_SHARD_QUEUE or None
+
+# Ansible run host results, gzip json lines file every run history, saved
+# to the history storage when the run finished, so it's read on any host.
+# With more than one worker host, the storage should be shared by them:
+# s3, or a "server" DIR on shared file system
+ANSIBLE_RESULT_DIR = os.path.join(PROJECT_DIR, 'data', 'ansible')
+
+# Results of old version run history saved in db and older than hot days
+# are archived to the storage, history older than retention days are
+# deleted, task can set it's own
+ANSIBLE_HISTORY_STORAGE = {
+    "TYPE": "server",
+    # "TYPE": "s3",
+    # "BUCKET": "jumpserver",
+    # "ACCESS_KEY": "",
+    # "SECRET_KEY": "",
+    # "REGION": "",
+    # "ENDPOINT": "",
+}
+ANSIBLE_HISTORY_HOT_DAYS = CONFIG.ANSIBLE_HISTORY_HOT_DAYS or 7
+ANSIBLE_HISTORY_RETENTION_DAYS = CONFIG.ANSIBLE_HISTORY_RETENTION_DAYS or 180
+
+# Max concurrent ssh handshakes of connectivity test, in one worker, and
+# threads doing the ssh auth of reachable hosts
+SSH_PROBE_CONCURRENCY = CONFIG.SSH_PROBE_CONCURRENCY or 500
+SSH_PROBE_THREADS = CONFIG.SSH_PROBE_THREADS or 50
+
 # Cache use redis
 CACHES = {
     'default': {
@@ -404,6 +440,21 @@ BOOTSTRAP3 = {
 }
 
 TOKEN_EXPIRATION = CONFIG.TOKEN_EXPIRATION or 3600
+# Access key auth info cached seconds, expired when key deleted or user changed
+ACCESS_KEY_CACHE_TTL = CONFIG.ACCESS_KEY_CACHE_TTL or 300
+# Reject the signature used before in the 15 minutes window, so every request
+# of the app should have a different Date header
+ACCESS_KEY_NONCE_CHECK = CONFIG.ACCESS_KEY_NONCE_CHECK or False
 DISPLAY_PER_PAGE = CONFIG.DISPLAY_PER_PAGE or 25
+# Login city resolved by the local GeoLite2 city database, download it from
+# https://dev.maxmind.com/geoip/geoip2/geolite2/
+GEOIP_CITY_DB = CONFIG.GEOIP_CITY_DB or os.path.join(PROJECT_DIR, 'data', 'geoip', 'GeoLite2-City.mmdb')
+# Login logs are buffered and written in batch, when up to the size or seconds
+LOGIN_LOG_BATCH_SIZE = CONFIG.LOGIN_LOG_BATCH_SIZE or 500
+LOGIN_LOG_FLUSH_INTERVAL = CONFIG.LOGIN_LOG_FLUSH_INTERVAL or 10
+# Login logs failed writing more times are moved to the dead letter queue
+LOGIN_LOG_MAX_RETRIES = CONFIG.LOGIN_LOG_MAX_RETRIES or 3
+# Login logs older than the days are deleted
+LOGIN_LOG_KEEP_DAYS = CONFIG.LOGIN_LOG_KEEP_DAYS or 365
 DEFAULT_EXPIRED_YEARS = 70
 USER_GUIDE_URL = ""
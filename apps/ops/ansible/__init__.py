@@ -4,3 +4,4 @@ from .callback import *
 from .inventory import *
 from .runner import *
 from .exceptions import *
+from .sink import *
@@ -8,7 +8,12 @@ class AdHocResultCallback(CallbackModule):
     """
     Task result Callback
     """
-    def __init__(self, display=None, options=None):
+    # Only keep these of a task result in the summary dark, the full
+    # result is in results raw
+    DARK_RESULT_KEYS = ('msg', 'stderr', 'rc', 'unreachable', 'changed')
+    DARK_VALUE_MAX_LENGTH = 1024
+
+    def __init__(self, display=None, options=None, sink=None):
         # result_raw example: {
         #   "ok": {"hostname": {"task_name": {}，...},..},
         #   "failed": {"hostname": {"task_name": {}..}, ..},
@@ -17,37 +22,57 @@ class AdHocResultCallback(CallbackModule):
         # }
         # results_summary example: {
         #   "contacted": {"hostname",...},
-        #   "dark": {"hostname": {"task_name": {}, "task_name": {}},...,},
+        #   "dark": {"hostname": {"task_name": {"msg": ""}, ..},...,},
         # }
-        self.results_raw = dict(ok={}, failed={}, unreachable={}, skipped={})
-        self.results_summary = dict(contacted=[], dark={})
+        # If a sink given, host results are written to it as they come,
+        # and results_raw is the reader of the sink
+        self.sink = sink
+        if sink is not None:
+            self.results_raw = sink.get_reader()
+        else:
+            self.results_raw = dict(ok={}, failed={}, unreachable={}, skipped={})
+        self.contacted = set()
+        self.dark = {}
         super().__init__()
 
+    @property
+    def results_summary(self):
+        return dict(contacted=sorted(self.contacted), dark=self.dark)
+
     def gather_result(self, t, res):
         self._clean_results(res._result, res._task.action)
         host = res._host.get_name()
         task_name = res.task_name
         task_result = res._result
 
-        if self.results_raw[t].get(host):
+        if self.sink is not None:
+            self.sink.write(t, host, task_name, task_result)
+        elif self.results_raw[t].get(host):
             self.results_raw[t][host][task_name] = task_result
         else:
             self.results_raw[t][host] = {task_name: task_result}
         self.clean_result(t, host, task_name, task_result)
 
     def clean_result(self, t, host, task_name, task_result):
-        contacted = self.results_summary["contacted"]
-        dark = self.results_summary["dark"]
-        if t in ("ok", "skipped") and host not in dark:
-            if host not in contacted:
-                contacted.append(host)
+        if t in ("ok", "skipped") and host not in self.dark:
+            self.contacted.add(host)
         else:
-            if dark.get(host):
-                dark[host][task_name] = task_result.values
-            else:
-                dark[host] = {task_name: task_result}
-            if host in contacted:
-                contacted.remove(host)
+            self.dark.setdefault(host, {})[task_name] = self.trim_result(task_result)
+            self.contacted.discard(host)
+
+    @classmethod
+    def trim_result(cls, task_result):
+        if not isinstance(task_result, dict):
+            return task_result
+        result = {}
+        for k in cls.DARK_RESULT_KEYS:
+            if k not in task_result:
+                continue
+            v = task_result[k]
+            if isinstance(v, str):
+                v = v[:cls.DARK_VALUE_MAX_LENGTH]
+            result[k] = v
+        return result
 
     def v2_runner_on_failed(self, result, ignore_errors=False):
         self.gather_result("failed", result)
@@ -70,7 +95,7 @@ class CommandResultCallback(AdHocResultCallback):
     """
     Command result callback
     """
-    def __init__(self, display=None):
+    def __init__(self, display=None, options=None, sink=None):
         # results_command: {
         #   "cmd": "",
         #   "stderr": "",
@@ -80,7 +105,7 @@ class CommandResultCallback(AdHocResultCallback):
         # }
         #
         self.results_command = dict()
-        super().__init__(display)
+        super().__init__(display, options=options, sink=sink)
 
     def gather_result(self, t, res):
         super().gather_result(t, res)
@@ -1,6 +1,7 @@
 # ~*~ coding: utf-8 ~*~
 
 import os
+import math
 from collections import namedtuple
 from ansible.executor.task_queue_manager import TaskQueueManager
 from ansible.vars.manager import VariableManager
@@ -15,10 +16,21 @@ from common.utils import get_logger
 from .exceptions import AnsibleError
 
 
-__all__ = ["AdHocRunner", "PlayBookRunner"]
+__all__ = [
+    "AdHocRunner", "PlayBookRunner", "get_adaptive_forks",
+    "get_adaptive_timeout",
+]
 C.HOST_KEY_CHECKING = False
 logger = get_logger(__name__)
 
+MAX_FORKS = 100
+FORKS_PER_CPU = 8
+FORK_MEMORY = 64 * 1024 * 1024
+DEFAULT_TIMEOUT = 60
+MAX_TIMEOUT = 300
+TIMEOUT_P95_FACTOR = 3
+TIMEOUT_MIN_SAMPLES = 5
+
 
 Options = namedtuple('Options', [
     'listtags', 'listtasks', 'listhosts', 'syntax', 'connection',
@@ -61,6 +73,52 @@ def get_default_options():
     return options
 
 
+def get_adaptive_forks(hosts_count, max_forks=None):
+    """
+    Forks enough for the hosts, but no more than cpu and available memory
+    of this machine can hold
+    """
+    cpu_count = os.cpu_count() or 1
+    forks = min(hosts_count, cpu_count * FORKS_PER_CPU, max_forks or MAX_FORKS)
+    memory = get_available_memory()
+    if memory is not None:
+        forks = min(forks, memory // FORK_MEMORY)
+    return max(int(forks), 1)
+
+
+def get_available_memory():
+    """
+    Memory can be used without swapping, the `MemAvailable` of
+    /proc/meminfo, free memory not counts the reclaimable page cache.
+    :return: bytes, or None if unknown
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def get_adaptive_timeout(latencies, min_timeout=None):
+    """
+    Ssh connect timeout from the p95 of hosts connect latency, only
+    reachable hosts are sampled. The configured timeout is the floor,
+    it's only raised for slow networks, up to `MAX_TIMEOUT`
+    :param latencies: [seconds, ..] tcp connect of the hosts
+    :param min_timeout: Timeout configured, using it if no enough history
+    """
+    min_timeout = min_timeout or DEFAULT_TIMEOUT
+    if len(latencies) < TIMEOUT_MIN_SAMPLES:
+        return min_timeout
+    latencies = sorted(latencies)
+    p95 = latencies[math.ceil(len(latencies) * 0.95) - 1]
+    timeout = math.ceil(p95 * TIMEOUT_P95_FACTOR)
+    return max(min(timeout, MAX_TIMEOUT), min_timeout)
+
+
 # Jumpserver not use playbook
 class PlayBookRunner:
     """
@@ -163,15 +221,17 @@ class AdHocRunner:
         kwargs = {k: v}
         self.options = self.options._replace(**kwargs)
 
-    def run(self, tasks, pattern, play_name='Ansible Ad-hoc', gather_facts='no'):
+    def run(self, tasks, pattern, play_name='Ansible Ad-hoc', gather_facts='no',
+            sink=None):
         """
         :param tasks: [{'action': {'module': 'shell', 'args': 'ls'}, ...}, ]
         :param pattern: all, *, or others
         :param play_name: The play name
+        :param sink: Write host results to it, instead of keeping in memory
         :return:
         """
         self.check_pattern(pattern)
-        results_callback = self.results_callback_class()
+        results_callback = self.results_callback_class(sink=sink)
         cleaned_tasks = self.clean_tasks(tasks)
 
         play_source = dict(
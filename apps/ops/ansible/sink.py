@@ -0,0 +1,213 @@
+# ~*~ coding: utf-8 ~*~
+
+import os
+import time
+import json
+import gzip
+import heapq
+import tempfile
+from itertools import groupby
+
+__all__ = [
+    'JSONLinesResultSink', 'ResultsRawReader', 'ResultsNotFound',
+    'sort_results_file', 'clean_results_dir',
+]
+
+
+class ResultsNotFound(Exception):
+    pass
+
+
+class JSONLinesResultSink:
+    """
+    Write every host task result to a gzip json lines file when it comes,
+    so a run keep nothing of the raw results in memory.
+    One line one result: [status, hostname, task_name, result]
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def write(self, status, host, task_name, result):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+        line = json.dumps([status, host, task_name, result], default=str)
+        self._file.write(line + '\n')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def get_reader(self):
+        return ResultsRawReader(self.path)
+
+
+def _line_host(line):
+    return json.loads(line)[1]
+
+
+def _write_sorted_run(lines, dir_name):
+    lines.sort(key=_line_host)
+    fd, path = tempfile.mkstemp(dir=dir_name, suffix='.run')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    return path
+
+
+def sort_results_file(path, chunk_size=8*1024*1024):
+    """
+    Sort lines of the results file by hostname, so results of a host are
+    adjacent lines and can be read one host a time. Using external merge
+    sort, at most `chunk_size` of lines are in memory
+    """
+    if not os.path.isfile(path):
+        return
+    dir_name = os.path.dirname(path)
+    runs = []
+    files = []
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            lines, size = [], 0
+            for line in f:
+                lines.append(line)
+                size += len(line)
+                if size >= chunk_size:
+                    runs.append(_write_sorted_run(lines, dir_name))
+                    lines, size = [], 0
+            if lines:
+                runs.append(_write_sorted_run(lines, dir_name))
+        files = [open(run, encoding='utf-8') for run in runs]
+        tmp_path = path + '.sorted'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for line in heapq.merge(*files, key=_line_host):
+                f.write(line)
+        os.rename(tmp_path, path)
+    finally:
+        for f in files:
+            f.close()
+        for run in runs:
+            os.remove(run)
+
+
+def clean_results_dir(dir_name, expired=3600*24):
+    """
+    Delete results files not modified in `expired` seconds
+    """
+    if not os.path.isdir(dir_name):
+        return
+    now = time.time()
+    for name in os.listdir(dir_name):
+        path = os.path.join(dir_name, name)
+        try:
+            if now - os.path.getmtime(path) > expired:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+class ResultsStatusView:
+    """
+    Results of one status, items is a generator yield
+    (hostname, {task_name: result}), one for a host. Lines of the file
+    should be sorted by host, see `sort_results_file`
+    """
+    def __init__(self, reader, status):
+        self.reader = reader
+        self.status = status
+
+    def items(self):
+        lines = self.reader.iter_lines(self.status)
+        for host, host_lines in groupby(lines, key=lambda item: item[1]):
+            yield host, {task_name: result for _, _, task_name, result in host_lines}
+
+    def keys(self):
+        for host, _ in groupby(self.reader.iter_lines(self.status), key=lambda item: item[1]):
+            yield host
+
+    def __iter__(self):
+        return self.keys()
+
+
+class ResultsRawReader:
+    """
+    Read results of sink file lazily, using it like results raw:
+    `reader.get('ok', {}).items()`. If the file is not on this host, it is
+    restored from the history storage by the archive name, so the reader
+    can be passed to the callback task running on any host.
+    A reader of no path has no result, others raise `ResultsNotFound` if
+    the results can't be found
+    """
+    statuses = ('ok', 'failed', 'unreachable', 'skipped')
+
+    def __init__(self, path, archive=None):
+        self.path = path
+        self.archive = archive
+
+    @property
+    def restored_path(self):
+        return os.path.join(
+            os.path.dirname(self.path), 'restored', os.path.basename(self.path)
+        )
+
+    def exists(self):
+        return self.path is not None
+
+    def restore(self):
+        """
+        Download the archived results to local, the restored files are
+        cleaned after a while
+        """
+        path = self.restored_path
+        if os.path.isfile(path):
+            return path
+        from ..backends import get_history_store
+        data = get_history_store().read(self.archive)
+        if data is None:
+            raise ResultsNotFound("Archived results not found: {}".format(self.archive))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+        return path
+
+    def get_local_path(self):
+        if os.path.isfile(self.path):
+            return self.path
+        if self.archive:
+            return self.restore()
+        raise ResultsNotFound("Results not found: {}".format(self.path))
+
+    def iter_lines(self, status=None):
+        if not self.exists():
+            return
+        with gzip.open(self.get_local_path(), 'rt', encoding='utf-8') as f:
+            for line in f:
+                item = json.loads(line)
+                if status is None or item[0] == status:
+                    yield item
+
+    def get(self, status, default=None):
+        if status not in self.statuses:
+            return default
+        return ResultsStatusView(self, status)
+
+    def __getitem__(self, status):
+        if status not in self.statuses:
+            raise KeyError(status)
+        return ResultsStatusView(self, status)
+
+    def keys(self):
+        return self.statuses
+
+    def items(self):
+        for status in self.statuses:
+            yield status, self[status]
+
+    def to_dict(self):
+        raw = {status: {} for status in self.statuses}
+        for status, host, task_name, result in self.iter_lines():
+            raw.setdefault(status, {}).setdefault(host, {})[task_name] = result
+        return raw
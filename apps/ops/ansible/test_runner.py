@@ -6,7 +6,8 @@ import sys
 
 sys.path.insert(0, "../..")
 
-from ops.ansible.runner import AdHocRunner, CommandRunner
+from ops.ansible.runner import AdHocRunner, CommandRunner, \
+    get_adaptive_timeout, MAX_TIMEOUT, DEFAULT_TIMEOUT
 from ops.ansible.inventory import BaseInventory
 
 
@@ -61,5 +62,21 @@ class TestCommandRunner(unittest.TestCase):
         # print(res.results_raw,22222222222)
 
 
+class TestAdaptiveTimeout(unittest.TestCase):
+    def test_no_enough_samples(self):
+        self.assertEqual(get_adaptive_timeout([1, 2]), DEFAULT_TIMEOUT)
+        self.assertEqual(get_adaptive_timeout([1, 2], min_timeout=10), 10)
+
+    def test_p95_factor(self):
+        latencies = [2] * 18 + [4, 100]
+        # p95 of 20 samples is the 19th one
+        self.assertEqual(get_adaptive_timeout(latencies, min_timeout=10), 12)
+
+    def test_bounds(self):
+        # Fast network never lower the timeout configured
+        self.assertEqual(get_adaptive_timeout([0.01] * 10, min_timeout=10), 10)
+        self.assertEqual(get_adaptive_timeout([500] * 10, min_timeout=10), MAX_TIMEOUT)
+
+
 if __name__ == "__main__":
     unittest.main()
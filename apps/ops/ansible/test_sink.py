@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+sys.path.insert(0, "../..")
+
+from ops.ansible.sink import JSONLinesResultSink, ResultsRawReader, \
+    ResultsNotFound, sort_results_file
+
+
+class TestResultsRawReader(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'result', 'test.jsonl.gz')
+        sink = JSONLinesResultSink(self.path)
+        sink.write('ok', 'host1', 'task1', {'rc': 0})
+        sink.write('failed', 'host2', 'task1', {'rc': 1})
+        sink.write('ok', 'host1', 'task2', {'rc': 0})
+        sink.close()
+        sort_results_file(self.path)
+        self.reader = sink.get_reader()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_items_one_per_host(self):
+        self.assertEqual(list(self.reader['ok'].items()), [
+            ('host1', {'task1': {'rc': 0}, 'task2': {'rc': 0}}),
+        ])
+        self.assertEqual(list(self.reader['ok'].keys()), ['host1'])
+        self.assertEqual(list(self.reader.get('failed', {})), ['host2'])
+
+    def test_to_dict(self):
+        self.assertEqual(self.reader.to_dict(), {
+            'ok': {'host1': {'task1': {'rc': 0}, 'task2': {'rc': 0}}},
+            'failed': {'host2': {'task1': {'rc': 1}}},
+            'unreachable': {},
+            'skipped': {},
+        })
+
+    def test_unknown_status(self):
+        self.assertEqual(self.reader.get('unknown', {}), {})
+        with self.assertRaises(KeyError):
+            self.reader['unknown']
+
+    def test_sort_results_file(self):
+        sort_results_file(self.path, chunk_size=1)
+        hosts = [host for _, host, _, _ in self.reader.iter_lines()]
+        self.assertEqual(hosts, ['host1', 'host1', 'host2'])
+
+    def test_no_results(self):
+        reader = ResultsRawReader(None)
+        self.assertFalse(reader.exists())
+        self.assertEqual(list(reader['ok'].items()), [])
+
+    def test_file_not_exist(self):
+        reader = ResultsRawReader(os.path.join(self.dir, 'none.jsonl.gz'))
+        with self.assertRaises(ResultsNotFound):
+            list(reader.iter_lines())
+
+if __name__ == "__main__":
+    unittest.main()
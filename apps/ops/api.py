@@ -7,6 +7,7 @@ from rest_framework.views import Response
 
 from .hands import IsSuperUser
 from .models import Task, AdHoc, AdHocRunHistory
+from .ansible import ResultsNotFound
 from .serializers import TaskSerializer, AdHocSerializer, AdHocRunHistorySerializer
 from .tasks import run_ansible_task
 
@@ -58,3 +59,42 @@ class AdHocRunHistorySet(viewsets.ModelViewSet):
             adhoc = get_object_or_404(AdHoc, id=adhoc_id)
             self.queryset = self.queryset.filter(adhoc=adhoc)
         return self.queryset
+
+
+class AdHocRunHistoryResultApi(generics.RetrieveAPIView):
+    """
+    Page the host results of a run history,
+    params: status=ok|failed|unreachable|skipped, offset=0, limit=100
+    """
+    queryset = AdHocRunHistory.objects.all()
+    permission_classes = (IsSuperUser,)
+
+    def retrieve(self, request, *args, **kwargs):
+        history = self.get_object()
+        status = request.query_params.get('status') or None
+        try:
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+            limit = min(max(int(request.query_params.get('limit', 100)), 1), 1000)
+        except ValueError:
+            return Response({"error": "Offset or limit not valid"}, status=400)
+        try:
+            results = history.get_host_results(status=status, offset=offset, limit=limit)
+        except ResultsNotFound as e:
+            return Response({"error": str(e)}, status=404)
+        return Response(results)
+
+
+class TaskFailedHostsApi(generics.RetrieveAPIView):
+    """
+    Failed hosts of the task latest runs, params: runs=30
+    """
+    queryset = Task.objects.all()
+    permission_classes = (IsSuperUser,)
+
+    def retrieve(self, request, *args, **kwargs):
+        task = self.get_object()
+        try:
+            count = min(max(int(request.query_params.get('runs', 30)), 1), 1000)
+        except ValueError:
+            return Response({"error": "Runs not valid"}, status=400)
+        return Response(list(task.get_failed_hosts(count=count)))
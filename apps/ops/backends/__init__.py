@@ -0,0 +1,21 @@
+from importlib import import_module
+from django.conf import settings
+
+TYPE_ENGINE_MAPPING = {
+    'server': 'ops.backends.file',
+    's3': 'ops.backends.s3',
+}
+
+
+def get_history_store():
+    """
+    Storage of the archived adhoc run history results
+    """
+    params = settings.ANSIBLE_HISTORY_STORAGE
+    tp = params.get('TYPE', 'server')
+    if not TYPE_ENGINE_MAPPING.get(tp):
+        raise AssertionError("History storage type should in {}".format(
+            ', '.join(TYPE_ENGINE_MAPPING.keys()))
+        )
+    engine_class = import_module(TYPE_ENGINE_MAPPING[tp])
+    return engine_class.HistoryStore(params)
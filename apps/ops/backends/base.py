@@ -0,0 +1,25 @@
+# coding: utf-8
+import abc
+
+
+class HistoryStoreBase(object):
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def save(self, name, data):
+        """
+        :param name: Object name
+        :param data: bytes, compressed already
+        """
+        pass
+
+    @abc.abstractmethod
+    def read(self, name):
+        """
+        :return: bytes or None if not exist
+        """
+        pass
+
+    @abc.abstractmethod
+    def delete(self, name):
+        pass
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+#
+import os
+
+from django.conf import settings
+
+from .base import HistoryStoreBase
+
+
+class HistoryStore(HistoryStoreBase):
+    def __init__(self, params):
+        self.dir = params.get('DIR') or \
+                   os.path.join(settings.PROJECT_DIR, 'data', 'ansible_archive')
+
+    def get_path(self, name):
+        return os.path.join(self.dir, name)
+
+    def save(self, name, data):
+        os.makedirs(self.dir, exist_ok=True)
+        path = self.get_path(name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+
+    def read(self, name):
+        path = self.get_path(name)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def delete(self, name):
+        path = self.get_path(name)
+        if os.path.isfile(path):
+            os.remove(path)
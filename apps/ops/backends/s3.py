@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+#
+
+import boto3
+from botocore.exceptions import ClientError
+
+from .base import HistoryStoreBase
+
+
+class HistoryStore(HistoryStoreBase):
+    def __init__(self, params):
+        self.bucket = params.get('BUCKET', 'jumpserver')
+        self.prefix = params.get('PREFIX', 'ansible/')
+        self.client = boto3.client(
+            's3',
+            aws_access_key_id=params.get('ACCESS_KEY'),
+            aws_secret_access_key=params.get('SECRET_KEY'),
+            region_name=params.get('REGION'),
+            endpoint_url=params.get('ENDPOINT'),
+        )
+
+    def get_key(self, name):
+        return self.prefix + name
+
+    def save(self, name, data):
+        self.client.put_object(
+            Bucket=self.bucket, Key=self.get_key(name), Body=data,
+        )
+
+    def read(self, name):
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self.get_key(name))
+        except ClientError:
+            return None
+        return obj['Body'].read()
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self.get_key(name))
@@ -1,14 +1,152 @@
 # -*- coding: utf-8 -*-
 #
 
+import json
+import threading
+from collections import OrderedDict
+from hashlib import md5
+
+from common.utils import get_signer
 from .ansible.inventory import BaseInventory
-from assets.utils import get_assets_by_hostname_list, get_system_user_by_name
+from assets.utils import get_assets_by_hostname_list, get_system_user_by_name, \
+    get_inventory_version
 
 __all__ = [
-    'JMSInventory'
+    'JMSInventory', 'get_jms_host_list',
 ]
 
 
+class HostListCache:
+    """
+    Host list built in this process, keyed by the hash of the build params
+    and the inventory version, which changes when assets, their auth info
+    or nodes changed. Secret in it never leave the process memory.
+    Private key file paths are not cached, key files may be cleaned, so the
+    hosts keep the key owner user, see `resolve_private_key`
+    """
+    size = 32
+
+    def __init__(self):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(hostname_list, *args):
+        data = json.dumps([sorted(hostname_list), args], default=str)
+        return md5(data.encode('utf-8')).hexdigest(), get_inventory_version()
+
+    def get(self, key):
+        with self._lock:
+            host_list = self._data.get(key)
+            if host_list is not None:
+                self._data.move_to_end(key)
+            return host_list
+
+    def set(self, key, host_list):
+        with self._lock:
+            self._data[key] = host_list
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+
+host_list_cache = HostListCache()
+signer = get_signer()
+
+
+def get_admin_users_info(admin_users):
+    # Same as `AdminUser.password`, None if no password set
+    with_password = [u for u in admin_users if u._password]
+    passwords = dict(zip(
+        [u.id for u in with_password],
+        signer.unsign_many([u._password for u in with_password]),
+    ))
+    admin_users_info = {}
+    for admin_user in admin_users:
+        admin_users_info[admin_user.id] = {
+            'username': admin_user.username,
+            'password': passwords.get(admin_user.id),
+            'private_key_user': admin_user,
+            'become': admin_user.become_info,
+        }
+    return admin_users_info
+
+
+def get_admin_host_list(assets):
+    """
+    Same as `Asset._to_secret_json`, but the admin user auth info is
+    unsigned once for all of its assets, and nodes are prefetched
+    """
+    assets = list(assets.select_related('admin_user').prefetch_related('nodes'))
+    admin_users = {a.admin_user_id: a.admin_user for a in assets if a.admin_user}
+    admin_users_info = get_admin_users_info(list(admin_users.values()))
+    host_list = []
+    for asset in assets:
+        data = asset.to_json()
+        if asset.admin_user_id in admin_users_info:
+            data.update(admin_users_info[asset.admin_user_id])
+            data['groups'] = [node.value for node in asset.nodes.all()]
+        host_list.append(data)
+    return host_list
+
+
+def build_jms_host_list(hostname_list, run_as_admin=False, run_as=None, become_info=None):
+    assets = get_assets_by_hostname_list(hostname_list)
+    if run_as_admin:
+        return get_admin_host_list(assets)
+
+    host_list = [asset.to_json() for asset in assets]
+    if run_as:
+        run_user_info = get_run_user_info(run_as)
+        for host in host_list:
+            host.update(run_user_info)
+    if become_info:
+        for host in host_list:
+            host.update(become_info)
+    return host_list
+
+
+def get_jms_host_list(hostname_list, run_as_admin=False, run_as=None, become_info=None):
+    """
+    Get the hosts data with auth info of the assets, see `BaseHost`
+    """
+    key = host_list_cache.get_key(
+        hostname_list, run_as_admin, run_as, become_info
+    )
+    host_list = host_list_cache.get(key)
+    if host_list is None:
+        host_list = build_jms_host_list(
+            hostname_list, run_as_admin=run_as_admin, run_as=run_as,
+            become_info=become_info,
+        )
+        host_list_cache.set(key, host_list)
+    return [resolve_private_key(host) for host in host_list]
+
+
+def resolve_private_key(host):
+    """
+    Set the private key file path of the host by it's key owner user,
+    the file is written again if it's cleaned
+    """
+    host = dict(host)
+    user = host.pop('private_key_user', None)
+    if user is not None:
+        host['private_key'] = user.private_key_file
+    return host
+
+
+def get_run_user_info(run_as):
+    system_user = get_system_user_by_name(run_as)
+    if not system_user:
+        return {}
+    return {
+        'name': system_user.name,
+        'username': system_user.username,
+        'password': system_user.password,
+        'public_key': system_user.public_key,
+        'private_key_user': system_user,
+    }
+
+
 class JMSInventory(BaseInventory):
     """
     JMS Inventory is the manager with jumpserver assets, so you can
@@ -20,27 +158,11 @@ class JMSInventory(BaseInventory):
         self.run_as = run_as
         self.become_info = become_info
 
-        assets = self.get_jms_assets()
-        if run_as_admin:
-            host_list = [asset._to_secret_json() for asset in assets]
-        else:
-            host_list = [asset.to_json() for asset in assets]
-            if run_as:
-                run_user_info = self.get_run_user_info()
-                for host in host_list:
-                    host.update(run_user_info)
-            if become_info:
-                for host in host_list:
-                    host.update(become_info)
+        host_list = get_jms_host_list(
+            hostname_list, run_as_admin=run_as_admin, run_as=run_as,
+            become_info=become_info,
+        )
         super().__init__(host_list=host_list)
 
-    def get_jms_assets(self):
-        assets = get_assets_by_hostname_list(self.hostname_list)
-        return assets
-
     def get_run_user_info(self):
-        system_user = get_system_user_by_name(self.run_as)
-        if not system_user:
-            return {}
-        else:
-            return system_user._to_secret_json()
+        return get_run_user_info(self.run_as)
@@ -1,10 +1,14 @@
 # ~*~ coding: utf-8 ~*~
 
+import os
 import json
 import uuid
+from itertools import islice, groupby
 
 import time
 from django.db import models
+from django.db.models import Count
+from django.conf import settings
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django_celery_beat.models import CrontabSchedule, IntervalSchedule, PeriodicTask
@@ -12,10 +16,13 @@ from django_celery_beat.models import CrontabSchedule, IntervalSchedule, Periodi
 from common.utils import get_signer, get_logger
 from common.celery import delete_celery_periodic_task, create_or_update_celery_periodic_tasks, \
      disable_celery_periodic_task
-from .ansible import AdHocRunner, AnsibleError
+from .ansible import AdHocRunner, AnsibleError, get_adaptive_forks, \
+    get_adaptive_timeout, JSONLinesResultSink, ResultsRawReader, \
+    sort_results_file, clean_results_dir
 from .inventory import JMSInventory
+from .backends import get_history_store
 
-__all__ = ["Task", "AdHoc", "AdHocRunHistory"]
+__all__ = ["Task", "AdHoc", "AdHocRunHistory", "AdHocRunHostResult"]
 
 
 logger = get_logger(__file__)
@@ -34,6 +41,7 @@ class Task(models.Model):
     is_periodic = models.BooleanField(default=False)
     callback = models.CharField(max_length=128, blank=True, null=True, verbose_name=_("Callback"))  # Callback must be a registered celery task
     is_deleted = models.BooleanField(default=False)
+    history_retention = models.IntegerField(verbose_name=_("History retention"), null=True, blank=True, help_text=_("Units: days"))
     comment = models.TextField(blank=True, verbose_name=_("Comment"))
     created_by = models.CharField(max_length=128, blank=True, null=True, default='')
     date_created = models.DateTimeField(auto_now_add=True)
@@ -77,6 +85,19 @@ class Task(models.Model):
     def get_run_history(self):
         return self.history.all()
 
+    def get_failed_hosts(self, count=30):
+        """
+        Failed hosts of the latest runs, and how many times they failed
+        :return: [{"hostname": "", "times": 0}, ..]
+        """
+        histories_id = list(
+            self.history.order_by('-date_start').values_list('id', flat=True)[:count]
+        )
+        return AdHocRunHostResult.objects.filter(
+            history_id__in=histories_id,
+            status__in=AdHocRunHostResult.FAILED_STATUS,
+        ).values('hostname').annotate(times=Count('id')).order_by('-times', 'hostname')
+
     def run(self, record=True):
         if self.latest_adhoc:
             return self.latest_adhoc.run(record=record)
@@ -177,6 +198,9 @@ class AdHoc(models.Model):
 
     @property
     def inventory(self):
+        return self.get_inventory()
+
+    def get_inventory(self, hosts=None):
         if self.become:
             become_info = {
                 'become': {
@@ -187,7 +211,7 @@ class AdHoc(models.Model):
             become_info = None
 
         inventory = JMSInventory(
-            self.hosts, run_as_admin=self.run_as_admin,
+            hosts or self.hosts, run_as_admin=self.run_as_admin,
             run_as=self.run_as, become_info=become_info
         )
         return inventory
@@ -205,33 +229,71 @@ class AdHoc(models.Model):
         else:
             return self._run_only()
 
+    def get_run_options(self, hosts=None, **options):
+        """
+        Forks of options only limit the max value, forks is chosen by hosts
+        count and resource of this machine. Timeout of options is the min
+        value, raised by the p95 of the hosts ssh connect latency
+        """
+        from .prober import get_hosts_connect_latency
+        hosts = hosts or self.hosts
+        options = dict(self.options, **options)
+        options['forks'] = get_adaptive_forks(
+            len(hosts), max_forks=options.get('forks')
+        )
+        options['timeout'] = get_adaptive_timeout(
+            get_hosts_connect_latency(hosts), min_timeout=options.get('timeout')
+        )
+        return options
+
+    def run_hosts(self, hosts, sink=None, **options):
+        """
+        Run on a shard of hosts only, the history is recorded when all
+        shards are merged
+        :param sink: Result sink of the shard, host results are written to it
+        :return: raw, summary
+        """
+        options = self.get_run_options(hosts, **options)
+        return self._run_only(hosts=hosts, sink=sink, **options)
+
     def _run_and_record(self):
         history = AdHocRunHistory(adhoc=self, task=self.task)
+        options = self.get_run_options()
         time_start = time.time()
+        sink = JSONLinesResultSink(history.result_file)
         try:
-            raw, summary = self._run_only()
+            _, summary = self._run_only(sink=sink, **options)
             history.is_finished = True
             if summary.get('dark'):
                 history.is_success = False
             else:
                 history.is_success = True
-            history.result = raw
             history.summary = summary
-            return raw, summary
         except Exception as e:
-            return {}, {"dark": {"all": str(e)}, "contacted": []}
+            summary = {"dark": {"all": str(e)}, "contacted": []}
         finally:
-            history.date_finished = timezone.now()
-            history.timedelta = time.time() - time_start
-            history.save()
-
-    def _run_only(self):
-        runner = AdHocRunner(self.inventory)
-        for k, v in self.options.items():
+            sink.close()
+        history.save_result()
+        history.date_finished = timezone.now()
+        history.timedelta = time.time() - time_start
+        history.save()
+        history.save_host_results()
+        return history.get_results_reader(), summary
+
+    def _run_only(self, hosts=None, sink=None, **options):
+        """
+        :param hosts: Only run on these hosts, a shard of adhoc hosts
+        :param sink: Result sink, host results are written to it
+        :param options: Running options, see `get_run_options`
+        """
+        runner = AdHocRunner(self.get_inventory(hosts))
+        if not options:
+            options = self.get_run_options(hosts)
+        for k, v in options.items():
             runner.set_option(k, v)
 
         try:
-            result = runner.run(self.tasks, self.pattern, self.task.name)
+            result = runner.run(self.tasks, self.pattern, self.task.name, sink=sink)
             return result.results_raw, result.results_summary
         except AnsibleError as e:
             logger.warn("Failed run adhoc {}, {}".format(self.task.name, e))
@@ -301,6 +363,9 @@ class AdHocRunHistory(models.Model):
     """
     AdHoc running history.
     """
+    # Archived history having no result, so it's not scanned again
+    RESULT_ARCHIVE_EMPTY = '-'
+
     id = models.UUIDField(default=uuid.uuid4, primary_key=True)
     task = models.ForeignKey(Task, related_name='history', on_delete=models.SET_NULL, null=True)
     adhoc = models.ForeignKey(AdHoc, related_name='history', on_delete=models.SET_NULL, null=True)
@@ -311,17 +376,114 @@ class AdHocRunHistory(models.Model):
     is_success = models.BooleanField(default=False, verbose_name=_('Is success'))
     _result = models.TextField(blank=True, null=True, verbose_name=_('Adhoc raw result'))
     _summary = models.TextField(blank=True, null=True, verbose_name=_('Adhoc result summary'))
+    result_archive = models.CharField(max_length=128, blank=True, default='', verbose_name=_('Result archive'))
 
     @property
     def short_id(self):
         return str(self.id).split('-')[-1]
 
+    @property
+    def result_name(self):
+        return '{}.jsonl.gz'.format(self.id)
+
+    @property
+    def result_file(self):
+        return os.path.join(settings.ANSIBLE_RESULT_DIR, self.result_name)
+
+    @property
+    def restored_result_file(self):
+        return os.path.join(
+            settings.ANSIBLE_RESULT_DIR, 'restored', self.result_name
+        )
+
+    def get_results_reader(self):
+        if self.result_archive == self.RESULT_ARCHIVE_EMPTY:
+            return ResultsRawReader(None)
+        return ResultsRawReader(self.result_file, archive=self.result_archive)
+
+    def write_result(self, raw):
+        sink = JSONLinesResultSink(self.result_file)
+        for t, hosts in raw.items():
+            for host, tasks in hosts.items():
+                for task_name, task_result in tasks.items():
+                    sink.write(t, host, task_name, task_result)
+        sink.close()
+
+    def save_result(self, store=None):
+        """
+        Save result file of the run to the history storage, so it can be
+        read on any host, called on the host running it. The local file is
+        kept as a restored one, cleaned after a while
+        """
+        if not os.path.isfile(self.result_file):
+            self.result_archive = self.RESULT_ARCHIVE_EMPTY
+            return
+        sort_results_file(self.result_file)
+        try:
+            store = store or get_history_store()
+            with open(self.result_file, 'rb') as f:
+                store.save(self.result_name, f.read())
+        except Exception as e:
+            # Result is still readable on this host
+            logger.error("Save result of history {} failed: {}".format(self.id, e))
+            return
+        self.result_archive = self.result_name
+        restored_dir = os.path.dirname(self.restored_result_file)
+        os.makedirs(restored_dir, exist_ok=True)
+        os.rename(self.result_file, self.restored_result_file)
+        # Every worker keep restored files, clean them when running
+        clean_results_dir(restored_dir)
+
+    def archive_result(self, store):
+        """
+        Move result of old version saved in db to the history storage, only
+        summary kept in db
+        """
+        if self.result_archive or not self._result:
+            return
+        self.write_result(self.result)
+        self.save_result(store)
+        if not self.result_archive:
+            return
+        self._result = None
+        self.save(update_fields=['_result', 'result_archive'])
+
+    def delete_result(self, store):
+        if self.result_archive and self.result_archive != self.RESULT_ARCHIVE_EMPTY:
+            store.delete(self.result_archive)
+        for path in (self.result_file, self.restored_result_file):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def get_host_results(self, status=None, offset=0, limit=100):
+        """
+        Page host results of the run, only read the lines needed
+        :return: [{"status": "", "hostname": "", "task": "", "result": {}}, ..]
+        """
+        if self._result:
+            lines = (
+                (t, host, task_name, result)
+                for t, hosts in self.result.items()
+                for host, tasks in hosts.items()
+                for task_name, result in tasks.items()
+            )
+            if status is not None:
+                lines = (line for line in lines if line[0] == status)
+        else:
+            lines = self.get_results_reader().iter_lines(status)
+        return [
+            {"status": t, "hostname": host, "task": task_name, "result": result}
+            for t, host, task_name, result in islice(lines, offset, offset + limit)
+        ]
+
     @property
     def result(self):
         if self._result:
             return json.loads(self._result)
-        else:
-            return {}
+        reader = self.get_results_reader()
+        if reader.exists():
+            return reader.to_dict()
+        return {}
 
     @result.setter
     def result(self, item):
@@ -346,9 +508,97 @@ class AdHocRunHistory(models.Model):
     def failed_hosts(self):
         return self.summary.get('dark', {})
 
+    def save_host_results(self, chunk_size=1000):
+        """
+        Save host results of the run to the result table, one row a host,
+        read from the result file one host a time and write in bulk
+        """
+        reader = self.get_results_reader()
+        if not reader.exists():
+            return
+        self.host_results.all().delete()
+        results = []
+        lines = reader.iter_lines()
+        for host, host_lines in groupby(lines, key=lambda item: item[1]):
+            host_result = None
+            for t, _, task_name, result in host_lines:
+                if host_result is None:
+                    host_result = AdHocRunHostResult(history=self, hostname=host, status=t)
+                host_result.add_task_result(t, result)
+            results.append(host_result)
+            if len(results) >= chunk_size:
+                AdHocRunHostResult.objects.bulk_create(results)
+                results = []
+        if results:
+            AdHocRunHostResult.objects.bulk_create(results)
+
     def __str__(self):
         return self.short_id
 
     class Meta:
         db_table = "ops_adhoc_history"
         get_latest_by = 'date_start'
+
+
+class AdHocRunHostResult(models.Model):
+    """
+    Host result of a run, so that failed hosts of runs can be queried
+    """
+    STATUS_OK = 'ok'
+    STATUS_SKIPPED = 'skipped'
+    STATUS_FAILED = 'failed'
+    STATUS_UNREACHABLE = 'unreachable'
+    STATUS_CHOICES = (
+        (STATUS_OK, 'Ok'),
+        (STATUS_SKIPPED, 'Skipped'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_UNREACHABLE, 'Unreachable'),
+    )
+    FAILED_STATUS = (STATUS_FAILED, STATUS_UNREACHABLE)
+    # Host status is the worst one of its tasks
+    STATUS_LEVELS = {
+        STATUS_SKIPPED: 0, STATUS_OK: 1, STATUS_FAILED: 2, STATUS_UNREACHABLE: 3,
+    }
+    STDOUT_MAX_LENGTH = 1024
+
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True)
+    history = models.ForeignKey(AdHocRunHistory, related_name='host_results', on_delete=models.CASCADE)
+    hostname = models.CharField(max_length=128, verbose_name=_('Hostname'))
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, verbose_name=_('Status'))
+    duration = models.FloatField(null=True, verbose_name=_('Duration'))
+    rc = models.IntegerField(null=True, verbose_name=_('Return code'))
+    stdout = models.CharField(max_length=STDOUT_MAX_LENGTH, blank=True, default='', verbose_name=_('Output'))
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def parse_delta(delta):
+        # Command module delta like: 0:00:00.003
+        try:
+            hours, minutes, seconds = str(delta).split(':')
+            return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        except (ValueError, TypeError):
+            return None
+
+    def add_task_result(self, status, result):
+        if self.STATUS_LEVELS.get(status, 0) > self.STATUS_LEVELS.get(self.status, 0):
+            self.status = status
+        if not isinstance(result, dict):
+            return
+        if isinstance(result.get('rc'), int):
+            self.rc = result['rc']
+        duration = self.parse_delta(result.get('delta'))
+        if duration is not None:
+            self.duration = (self.duration or 0) + duration
+        output = result.get('stdout') or result.get('msg') or ''
+        if output and len(self.stdout) < self.STDOUT_MAX_LENGTH:
+            stdout = '\n'.join([self.stdout, str(output)]) if self.stdout else str(output)
+            self.stdout = stdout[:self.STDOUT_MAX_LENGTH]
+
+    def __str__(self):
+        return '{}: {}'.format(self.hostname, self.status)
+
+    class Meta:
+        db_table = "ops_adhoc_host_result"
+        index_together = [
+            ('hostname', 'status'), ('history', 'status'),
+        ]
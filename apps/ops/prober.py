@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+from django.conf import settings
+from django.core.cache import cache
+
+from common.utils import get_logger
+from .inventory import get_jms_host_list
+
+__all__ = ['SSHProber', 'get_hosts_connect_latency']
+logger = get_logger(__file__)
+HOST_CONNECT_LATENCY_CACHE_KEY = 'OPS_HOST_CONNECT_LATENCY_{}'
+HOST_CONNECT_LATENCY_CACHE_TTL = 3600 * 24
+
+
+def get_hosts_connect_latency(hostname_list):
+    """
+    Tcp connect seconds of the hosts in the last probe, unreachable or not
+    probed hosts are not in
+    :return: [seconds, ..]
+    """
+    keys = [HOST_CONNECT_LATENCY_CACHE_KEY.format(h) for h in hostname_list]
+    return [v for v in cache.get_many(keys).values() if v is not None]
+
+
+class SSHProber:
+    """
+    Check hosts accept the auth or not, only ssh handshake and auth, no
+    ansible module running on them. The tcp connect of all hosts run in
+    one event loop, so unreachable hosts never hold a thread, reachable
+    ones do the auth with paramiko in the thread pool of
+    `SSH_PROBE_THREADS` threads.
+
+    The result is same as ansible summary: {"contacted": [], "dark": {}}
+    """
+    def __init__(self, host_list, timeout=10, concurrency=None, threads=None):
+        """
+        :param host_list: hosts data with auth info, see `BaseHost`
+        """
+        self.host_list = host_list
+        self.timeout = timeout
+        self.concurrency = concurrency or settings.SSH_PROBE_CONCURRENCY
+        self.threads = threads or settings.SSH_PROBE_THREADS
+        self.latencies = {}
+
+    @classmethod
+    def from_hostname_list(cls, hostname_list, run_as_admin=False,
+                           run_as=None, **kwargs):
+        host_list = get_jms_host_list(
+            hostname_list, run_as_admin=run_as_admin, run_as=run_as
+        )
+        return cls(host_list, **kwargs)
+
+    async def connect(self, host):
+        future = asyncio.open_connection(host['ip'], host.get('port') or 22)
+        time_start = time.time()
+        try:
+            reader, writer = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            return "Connect timeout"
+        except Exception as e:
+            return str(e) or e.__class__.__name__
+        writer.close()
+        self.latencies[host['hostname']] = time.time() - time_start
+        return None
+
+    def auth(self, host):
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            ssh.connect(
+                host['ip'], port=host.get('port') or 22,
+                username=host.get('username'), password=host.get('password'),
+                key_filename=host.get('private_key'), timeout=self.timeout,
+                banner_timeout=self.timeout, auth_timeout=self.timeout,
+                allow_agent=False, look_for_keys=False,
+            )
+        except Exception as e:
+            # Any error of a host is the host unreachable, not the whole run
+            return str(e) or e.__class__.__name__
+        finally:
+            ssh.close()
+        return None
+
+    async def probe(self, host, semaphore, executor):
+        async with semaphore:
+            error = await self.connect(host)
+            if error is None:
+                loop = asyncio.get_event_loop()
+                error = await loop.run_in_executor(executor, self.auth, host)
+        return error
+
+    async def probe_all(self, executor):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[
+            self.probe(host, semaphore, executor) for host in self.host_list
+        ], return_exceptions=True)
+
+    def run(self):
+        summary = {"contacted": [], "dark": {}}
+        if not self.host_list:
+            return summary
+
+        workers = min(self.threads, len(self.host_list))
+        loop = asyncio.new_event_loop()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = loop.run_until_complete(self.probe_all(executor))
+        finally:
+            loop.close()
+
+        for host, error in zip(self.host_list, results):
+            hostname = host['hostname']
+            if isinstance(error, BaseException):
+                error = str(error) or error.__class__.__name__
+            if error is None:
+                summary["contacted"].append(hostname)
+            else:
+                summary["dark"][hostname] = {"ping": error}
+        cache.set_many({
+            HOST_CONNECT_LATENCY_CACHE_KEY.format(h): self.latencies[h]
+            for h in summary["contacted"] if h in self.latencies
+        }, HOST_CONNECT_LATENCY_CACHE_TTL)
+        logger.debug("Probe {} hosts, dark {}".format(
+            len(results), len(summary["dark"])
+        ))
+        return summary
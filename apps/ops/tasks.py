@@ -1,8 +1,21 @@
 # coding: utf-8
-from celery import shared_task, subtask
+import os
+import time
+import uuid
+import datetime
+
+from celery import shared_task, subtask, chord
+from django.conf import settings
+from django.utils import timezone
 
 from common.utils import get_logger, get_object_or_none
-from .models import Task
+from common.celery import register_as_period_task, after_app_ready_start, \
+    after_app_shutdown_clean
+from .backends import get_history_store
+from .models import Task, AdHoc, AdHocRunHistory
+from .ansible import JSONLinesResultSink, ResultsNotFound, \
+    clean_results_dir
+from .utils import get_hosts_shards, merge_adhoc_results
 
 logger = get_logger(__file__)
 
@@ -21,6 +34,9 @@ def run_ansible_task(task_id, callback=None, **kwargs):
 
     task = get_object_or_none(Task, id=task_id)
     if task:
+        adhoc = task.latest_adhoc
+        if adhoc and len(get_hosts_shards(adhoc.hosts)) > 1:
+            return run_adhoc_sharded(adhoc, callback=callback)
         result = task.run()
         if callback is not None:
             subtask(callback).delay(result, task_name=task.name)
@@ -29,6 +45,193 @@ def run_ansible_task(task_id, callback=None, **kwargs):
         logger.error("No task found")
 
 
+def run_adhoc_sharded(adhoc, callback=None, **kwargs):
+    """
+    Run adhoc hosts shards as parallel celery subtasks, then merge them to
+    one run history, and call the callback with the merged result.
+    Shards are run in at most `ANSIBLE_SHARD_MAX_PARALLEL` lanes, shards of
+    a lane run one after another
+    :param adhoc: AdHoc instance
+    :param callback: callback task name, called as running task
+    :param kwargs: more callback kwargs
+    :return: AsyncResult of the merge task
+    """
+    shards = get_hosts_shards(adhoc.hosts)
+    parallel = min(len(shards), settings.ANSIBLE_SHARD_MAX_PARALLEL)
+    lanes = [shards[i::parallel] for i in range(parallel)]
+    options = {}
+    if settings.ANSIBLE_SHARD_QUEUE:
+        options['queue'] = settings.ANSIBLE_SHARD_QUEUE
+    logger.debug("Run adhoc {} in {} shards, {} lanes".format(
+        adhoc, len(shards), len(lanes))
+    )
+    header = [
+        run_adhoc_shards.s(str(adhoc.id), lane).set(**options)
+        for lane in lanes
+    ]
+    merge = merge_adhoc_shards.s(str(adhoc.id), callback=callback, **kwargs)
+    return chord(header)(merge)
+
+
+@shared_task
+def run_adhoc_shards(adhoc_id, shards):
+    """
+    Run shards one by one, host results are written to a result file, which
+    is saved to the history storage, so the merge task on any host can read
+    it. Only the summary and the result name are sent back through the
+    result backend
+    :param shards: [[host, ..], ..]
+    :return: result_name, summary, time_start
+    """
+    time_start = time.time()
+    name = 'shard-{}-{}.jsonl.gz'.format(adhoc_id, uuid.uuid4().hex)
+    adhoc = get_object_or_none(AdHoc, id=adhoc_id)
+    if not adhoc:
+        return None, {"contacted": [], "dark": {}}, time_start
+    options = {}
+    if settings.ANSIBLE_SHARD_FORKS:
+        options['forks'] = settings.ANSIBLE_SHARD_FORKS
+    path = os.path.join(settings.ANSIBLE_RESULT_DIR, 'shards', name)
+    sink = JSONLinesResultSink(path)
+    results = []
+    try:
+        for hosts in shards:
+            try:
+                _, summary = adhoc.run_hosts(hosts, sink=sink, **options)
+            except Exception as e:
+                logger.error("Run adhoc shard failed: {}".format(e))
+                dark = {host: {"all": "Shard run failed"} for host in hosts}
+                summary = {"contacted": [], "dark": dark}
+            results.append(summary)
+    finally:
+        sink.close()
+    summary = merge_adhoc_results(results)
+    if not os.path.isfile(path):
+        return None, summary, time_start
+    # Failed saving fails the chord, the merge task never lose results
+    with open(path, 'rb') as f:
+        get_history_store().save(name, f.read())
+    os.remove(path)
+    return name, summary, time_start
+
+
+@shared_task
+def merge_adhoc_shards(results, adhoc_id, callback=None, **kwargs):
+    """
+    Join the shards result files to the history result file, gzip members
+    concatenated is a valid gzip file, so copy them as it is. A shard result
+    not found fails the merge, no history of partial results is saved
+    """
+    store = get_history_store()
+    names = [name for name, _, _ in results if name]
+    adhoc = get_object_or_none(AdHoc, id=adhoc_id)
+    if not adhoc:
+        for name in names:
+            store.delete(name)
+        return
+    summary = merge_adhoc_results([summary for _, summary, _ in results])
+    time_start = min(start for _, _, start in results)
+    history = AdHocRunHistory(
+        adhoc=adhoc, task=adhoc.task, is_finished=True,
+        is_success=not summary.get('dark'),
+    )
+    os.makedirs(os.path.dirname(history.result_file), exist_ok=True)
+    try:
+        with open(history.result_file, 'wb') as f:
+            for name in names:
+                data = store.read(name)
+                if data is None:
+                    raise ResultsNotFound("Shard results not found: {}".format(name))
+                f.write(data)
+    except Exception:
+        if os.path.isfile(history.result_file):
+            os.remove(history.result_file)
+        raise
+    finally:
+        for name in names:
+            store.delete(name)
+    history.save_result(store)
+    history.summary = summary
+    history.date_finished = timezone.now()
+    history.timedelta = time.time() - time_start
+    history.save()
+    # Date start is set when created, the run start at the earliest shard
+    history.date_start = datetime.datetime.fromtimestamp(time_start, tz=timezone.utc)
+    history.save(update_fields=['date_start'])
+    history.save_host_results()
+    raw = history.get_results_reader()
+    if callback is not None:
+        subtask(callback).delay((raw, summary), task_name=adhoc.task.name, **kwargs)
+    return raw, summary
+
+
+def archive_adhoc_run_history(store):
+    days = settings.ANSIBLE_HISTORY_HOT_DAYS
+    date_expired = timezone.now() - datetime.timedelta(days=days)
+    # Results of runs are saved to the storage when finished, only the
+    # ones of old version saved in db are archived
+    histories = AdHocRunHistory.objects.filter(
+        date_start__lt=date_expired, result_archive='', _result__isnull=False
+    ).exclude(_result='')
+    count = 0
+    for history in histories.iterator():
+        try:
+            history.archive_result(store)
+        except Exception as e:
+            logger.error("Archive history {} failed: {}".format(history.id, e))
+            continue
+        count += 1
+    logger.info("Archive {} adhoc run history".format(count))
+
+
+def delete_adhoc_run_history(histories, store):
+    for history in histories.only('id', 'result_archive').iterator():
+        history.delete_result(store)
+    histories.delete()
+
+
+def clean_adhoc_run_history(store):
+    now = timezone.now()
+    default_days = settings.ANSIBLE_HISTORY_RETENTION_DAYS
+    retentions = Task.objects.exclude(history_retention=None)\
+        .values_list('id', 'history_retention')
+    for task_id, days in retentions:
+        date_expired = now - datetime.timedelta(days=days)
+        histories = AdHocRunHistory.objects.filter(
+            task_id=task_id, date_start__lt=date_expired
+        )
+        delete_adhoc_run_history(histories, store)
+
+    date_expired = now - datetime.timedelta(days=default_days)
+    histories = AdHocRunHistory.objects.filter(date_start__lt=date_expired)\
+        .exclude(task__history_retention__isnull=False)
+    delete_adhoc_run_history(histories, store)
+
+
+def clean_restored_results(expired=3600*24):
+    """
+    Clean restored results, and shards results left by failed runs
+    """
+    for dir_name in ('restored', 'shards'):
+        result_dir = os.path.join(settings.ANSIBLE_RESULT_DIR, dir_name)
+        clean_results_dir(result_dir, expired=expired)
+
+
+@shared_task
+@register_as_period_task(interval=3600*24)
+@after_app_ready_start
+@after_app_shutdown_clean
+def clean_adhoc_run_history_period():
+    """
+    Archive results of old run history to the storage,
+    delete the history out of the retention days
+    """
+    store = get_history_store()
+    archive_adhoc_run_history(store)
+    clean_adhoc_run_history(store)
+    clean_restored_results()
+
+
 @shared_task
 def hello(name, callback=None):
     print("Hello {}".format(name))
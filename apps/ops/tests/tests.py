@@ -1,3 +1,94 @@
-from django.test import TestCase
+import socket
+from unittest import mock
 
-# Create your tests here.
+import paramiko
+from django.test import SimpleTestCase, override_settings
+
+from ops.utils import get_hosts_shards, merge_adhoc_results
+from ops.prober import SSHProber, get_hosts_connect_latency
+
+
+class TestHostsShards(SimpleTestCase):
+    @override_settings(ANSIBLE_SHARD_SIZE=3)
+    def test_one_shard(self):
+        hosts = ['host1', 'host2', 'host3']
+        self.assertEqual(get_hosts_shards(hosts), [hosts])
+
+    @override_settings(ANSIBLE_SHARD_SIZE=3, ANSIBLE_SHARD_MAX_PARALLEL=1)
+    def test_keep_shard_size(self):
+        hosts = ['host{}'.format(i) for i in range(8)]
+        shards = get_hosts_shards(hosts)
+        self.assertEqual([len(s) for s in shards], [3, 3, 2])
+        self.assertEqual(sum(shards, []), hosts)
+
+
+class TestMergeAdhocResults(SimpleTestCase):
+    def test_merge(self):
+        results = [
+            {'contacted': ['host1', 'host2'], 'dark': {}},
+            {'contacted': ['host3'], 'dark': {'host4': {'ping': {'msg': ''}}}},
+            {'contacted': [], 'dark': {}},
+        ]
+        summary = merge_adhoc_results(results)
+        self.assertEqual(sorted(summary['contacted']), ['host1', 'host2', 'host3'])
+        self.assertEqual(list(summary['dark']), ['host4'])
+
+    def test_dark_not_contacted(self):
+        results = [
+            {'contacted': ['host1'], 'dark': {}},
+            {'contacted': [], 'dark': {'host1': {'all': 'Shard run failed'}}},
+        ]
+        summary = merge_adhoc_results(results)
+        self.assertEqual(summary['contacted'], [])
+        self.assertIn('host1', summary['dark'])
+
+
+class TestSSHProber(SimpleTestCase):
+    def setUp(self):
+        # Listening socket accepts tcp connect, the ssh auth is mocked
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(16)
+        self.port = self.server.getsockname()[1]
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        self.closed_port = closed.getsockname()[1]
+        closed.close()
+
+    def tearDown(self):
+        self.server.close()
+
+    def get_host(self, hostname, port=None, password='right'):
+        return {
+            'hostname': hostname, 'ip': '127.0.0.1',
+            'port': port or self.port, 'username': 'root', 'password': password,
+        }
+
+    @staticmethod
+    def connect(ip, password=None, **kwargs):
+        if password != 'right':
+            raise paramiko.AuthenticationException('Authentication failed.')
+
+    def test_probe(self):
+        host_list = [
+            self.get_host('probe-ok'),
+            self.get_host('probe-auth-failed', password='wrong'),
+            self.get_host('probe-refused', port=self.closed_port),
+        ]
+        prober = SSHProber(host_list, timeout=5, concurrency=2, threads=2)
+        with mock.patch.object(paramiko.SSHClient, 'connect', side_effect=self.connect) as connect:
+            summary = prober.run()
+        self.assertEqual(summary['contacted'], ['probe-ok'])
+        self.assertEqual(
+            summary['dark']['probe-auth-failed'], {'ping': 'Authentication failed.'}
+        )
+        self.assertIn('probe-refused', summary['dark'])
+        # Refused host not hold a thread for auth
+        self.assertEqual(connect.call_count, 2)
+        # Only latency of contacted hosts is kept for the timeout
+        self.assertEqual(len(get_hosts_connect_latency(
+            ['probe-ok', 'probe-auth-failed', 'probe-refused']
+        )), 1)
+
+    def test_no_hosts(self):
+        self.assertEqual(SSHProber([], threads=1).run(), {'contacted': [], 'dark': {}})
@@ -15,6 +15,8 @@ router.register(r'v1/history', api.AdHocRunHistorySet, 'history')
 
 urlpatterns = [
     url(r'^v1/tasks/(?P<pk>[0-9a-zA-Z\-]{36})/run/$', api.TaskRun.as_view(), name='task-run'),
+    url(r'^v1/tasks/(?P<pk>[0-9a-zA-Z\-]{36})/failed-hosts/$', api.TaskFailedHostsApi.as_view(), name='task-failed-hosts'),
+    url(r'^v1/history/(?P<pk>[0-9a-zA-Z\-]{36})/result/$', api.AdHocRunHistoryResultApi.as_view(), name='history-result'),
 ]
 
 urlpatterns += router.urls
@@ -1,6 +1,12 @@
 # ~*~ coding: utf-8 ~*~
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
 from common.utils import get_logger, get_object_or_none
-from .models import Task, AdHoc
+from .models import Task, AdHoc, AdHocRunHistory
+from .prober import SSHProber
 
 logger = get_logger(__file__)
 
@@ -50,4 +56,67 @@ def update_or_create_ansible_task(
     return task, created
 
 
+def run_probe_task(task_name, hosts, tasks, options=None,
+                   run_as_admin=False, run_as="", created_by='System'):
+    """
+    Test hosts connectivity with the ssh prober instead of running the
+    ansible ping tasks, the run is recorded as a history of the task
+    :return: raw, summary
+    """
+    task, created = update_or_create_ansible_task(
+        task_name=task_name, hosts=hosts, tasks=tasks, pattern='all',
+        options=options, run_as_admin=run_as_admin, run_as=run_as,
+        created_by=created_by,
+    )
+    history = AdHocRunHistory(adhoc=task.latest_adhoc, task=task)
+    time_start = time.time()
+    timeout = (options or {}).get('timeout', 10)
+    summary = SSHProber.from_hostname_list(
+        hosts, run_as_admin=run_as_admin, run_as=run_as or None,
+        timeout=timeout,
+    ).run()
+    raw = {
+        'ok': {h: {'ping': {'ping': 'pong'}} for h in summary['contacted']},
+        'unreachable': {
+            h: {'ping': {'msg': error.get('ping')}}
+            for h, error in summary['dark'].items()
+        },
+    }
+    history.write_result(raw)
+    history.save_result()
+    history.is_finished = True
+    history.is_success = not summary['dark']
+    history.summary = summary
+    history.date_finished = timezone.now()
+    history.timedelta = time.time() - time_start
+    history.save()
+    history.save_host_results()
+    return history.get_results_reader(), summary
+
+
+def get_hosts_shards(hosts):
+    """
+    Split hosts to shards of `ANSIBLE_SHARD_SIZE` hosts, runs having less
+    hosts is one shard
+    :return: [[host, ..], ..]
+    """
+    size = settings.ANSIBLE_SHARD_SIZE
+    if len(hosts) <= size:
+        return [hosts]
+    return [hosts[i:i + size] for i in range(0, len(hosts), size)]
+
 
+def merge_adhoc_results(results):
+    """
+    Merge shards results summary of adhoc run to one, as it run one time,
+    the raw results are kept in the shards result files
+    :param results: [results_summary, ..]
+    :return: summary
+    """
+    summary = dict(contacted=[], dark={})
+    contacted = set()
+    for shard_summary in results:
+        contacted.update(shard_summary.get('contacted', []))
+        summary['dark'].update(shard_summary.get('dark', {}))
+    summary['contacted'] = [h for h in contacted if h not in summary['dark']]
+    return summary
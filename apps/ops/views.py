@@ -3,12 +3,20 @@
 from django.utils.translation import ugettext as _
 from django.conf import settings
 from django.views.generic import ListView, DetailView
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
 from common.mixins import DatetimeSearchMixin
-from .models import Task, AdHoc, AdHocRunHistory
+from .models import Task, AdHoc, AdHocRunHistory, AdHocRunHostResult
 from .hands import AdminUserRequiredMixin
 
 
+def get_failed_tasks_msg(tasks):
+    return ' '.join(
+        '{} => {}'.format(name, result.get('msg', '') if isinstance(result, dict) else result)
+        for name, result in tasks.items()
+    )
+
+
 class TaskListView(AdminUserRequiredMixin, DatetimeSearchMixin, ListView):
     paginate_by = settings.DISPLAY_PER_PAGE
     model = Task
@@ -46,11 +54,40 @@ class TaskListView(AdminUserRequiredMixin, DatetimeSearchMixin, ListView):
 class TaskDetailView(AdminUserRequiredMixin, DetailView):
     model = Task
     template_name = 'ops/task_detail.html'
+    hosts_limit = settings.DISPLAY_PER_PAGE
+
+    def get_latest_hosts(self):
+        """
+        Latest run failed and success hosts, query the host result table,
+        only histories before it existed load the summary
+        :return: [(hostname, msg), ..], [hostname, ..]
+        """
+        history = self.object.latest_history
+        if not history:
+            return [], []
+        results = history.host_results.order_by('hostname')
+        if results.exists():
+            failed = results.filter(status__in=AdHocRunHostResult.FAILED_STATUS)\
+                .values_list('hostname', 'stdout')[:self.hosts_limit]
+            success = results.exclude(status__in=AdHocRunHostResult.FAILED_STATUS)\
+                .values_list('hostname', flat=True)[:self.hosts_limit]
+            return list(failed), list(success)
+
+        summary = history.summary
+        failed = []
+        for host, tasks in list(summary.get('dark', {}).items())[:self.hosts_limit]:
+            failed.append((host, get_failed_tasks_msg(tasks)))
+        success = summary.get('contacted', [])[:self.hosts_limit]
+        return failed, success
 
     def get_context_data(self, **kwargs):
+        failed_hosts, success_hosts = self.get_latest_hosts()
         context = {
             'app': _('Ops'),
             'action': _('Task detail'),
+            'failed_hosts': failed_hosts,
+            'success_hosts': success_hosts,
+            'recent_failed_hosts': self.object.get_failed_hosts()[:self.hosts_limit],
         }
         kwargs.update(context)
         return super().get_context_data(**kwargs)
@@ -111,11 +148,53 @@ class AdHocHistoryView(AdminUserRequiredMixin, DetailView):
 class AdHocHistoryDetailView(AdminUserRequiredMixin, DetailView):
     model = AdHocRunHistory
     template_name = 'ops/adhoc_history_detail.html'
+    paginate_by = settings.DISPLAY_PER_PAGE
+
+    def get_hosts_page(self, hosts):
+        paginator = Paginator(hosts, self.paginate_by)
+        try:
+            return paginator, paginator.page(self.request.GET.get('page', 1))
+        except (EmptyPage, PageNotAnInteger):
+            return paginator, None
+
+    def get_hosts(self):
+        """
+        Failed and success hosts of the run, page the host result table in
+        db, only histories before it existed load the summary
+        :return: [(hostname, msg), ..], [hostname, ..]
+        """
+        results = self.object.host_results.order_by('hostname')
+        if results.exists():
+            failed = results.filter(status__in=AdHocRunHostResult.FAILED_STATUS)\
+                .values_list('hostname', 'stdout')
+            success = results.exclude(status__in=AdHocRunHostResult.FAILED_STATUS)\
+                .values_list('hostname', flat=True)
+            return failed, success
+        summary = self.object.summary
+        failed = [
+            (host, get_failed_tasks_msg(tasks))
+            for host, tasks in summary.get('dark', {}).items()
+        ]
+        return failed, summary.get('contacted', [])
 
     def get_context_data(self, **kwargs):
+        # Run may has thousands of hosts, page success and failed hosts
+        # using the same page number, the longer one show the pagination
+        failed, success = self.get_hosts()
+        success_paginator, success_page = self.get_hosts_page(success)
+        failed_paginator, failed_page = self.get_hosts_page(failed)
+        if failed_paginator.num_pages > success_paginator.num_pages:
+            paginator, page_obj = failed_paginator, failed_page
+        else:
+            paginator, page_obj = success_paginator, success_page
         context = {
             'app': _('Ops'),
             'action': _('Run history detail'),
+            'success_hosts': success_page or [],
+            'failed_hosts': failed_page or [],
+            'paginator': paginator,
+            'page_obj': page_obj,
+            'is_paginated': paginator.num_pages > 1,
         }
         kwargs.update(context)
         return super().get_context_data(**kwargs)
\ No newline at end of file
@@ -1,5 +1,7 @@
 # ~*~ coding: utf-8 ~*~
 # 
+import uuid
+from collections import defaultdict
 
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView, Response
@@ -7,10 +9,10 @@ from rest_framework.generics import ListAPIView, get_object_or_404
 from rest_framework import viewsets
 
 from users.permissions import IsValidUser, IsSuperUser, IsSuperUserOrAppUser
-from .utils import NodePermissionUtil
+from .utils import NodePermissionUtil, UserGrantChecker
 from .models import NodePermission
-from .hands import AssetGrantedSerializer, User, UserGroup, Asset, \
-    NodeGrantedSerializer, SystemUser, NodeSerializer
+from .hands import AssetGrantedSerializer, User, UserGroup, \
+    NodeGrantedSerializer, NodeSerializer
 from . import serializers
 
 
@@ -206,12 +208,61 @@ class ValidateUserAssetPermissionView(APIView):
         asset_id = request.query_params.get('asset_id', '')
         system_id = request.query_params.get('system_user_id', '')
 
-        user = get_object_or_404(User, id=user_id)
-        asset = get_object_or_404(Asset, id=asset_id)
-        system_user = get_object_or_404(SystemUser, id=system_id)
+        try:
+            user_id, asset_id, system_id = [
+                uuid.UUID(i) for i in (user_id, asset_id, system_id)
+            ]
+        except ValueError:
+            return Response({'msg': False}, status=404)
 
-        assets_granted = NodePermissionUtil.get_user_assets(user)
-        if system_user in assets_granted.get(asset, []):
+        granted = UserGrantChecker.has_perm(user_id, asset_id, system_id)
+        if granted is None:
+            return Response({'msg': False}, status=404)
+        elif granted:
             return Response({'msg': True}, status=200)
         else:
             return Response({'msg': False}, status=403)
+
+
+class ValidateUserAssetPermissionBulkView(APIView):
+    """
+    Validate many (user, asset, system user) once, request data like:
+    [{"user_id": "", "asset_id": "", "system_user_id": ""}, ..]
+    response is the items with `msg` set to the verdict, keep same order
+    """
+    permission_classes = (IsSuperUserOrAppUser,)
+
+    @staticmethod
+    def post(request):
+        if not isinstance(request.data, list) or \
+                not all(isinstance(item, dict) for item in request.data):
+            return Response({'error': 'Data should be a list of object'}, status=400)
+
+        results = []
+        user_items = defaultdict(list)
+        for item in request.data:
+            result = {
+                'user_id': item.get('user_id', ''),
+                'asset_id': item.get('asset_id', ''),
+                'system_user_id': item.get('system_user_id', ''),
+                'msg': False,
+            }
+            results.append(result)
+            try:
+                user_id, asset_id, system_id = [
+                    uuid.UUID(str(result[k]))
+                    for k in ('user_id', 'asset_id', 'system_user_id')
+                ]
+            except ValueError:
+                continue
+            user_items[user_id].append((asset_id, system_id, result))
+
+        for user_id, items in user_items.items():
+            verdicts = UserGrantChecker.has_perms(
+                user_id, [(asset_id, system_id) for asset_id, system_id, _ in items]
+            )
+            if verdicts is None:
+                continue
+            for (_, _, result), granted in zip(items, verdicts):
+                result['msg'] = granted
+        return Response(results, status=200)
@@ -4,6 +4,7 @@
 from users.utils import AdminUserRequiredMixin
 from users.models import User, UserGroup
 from assets.models import Asset, AssetGroup, SystemUser, Node
+from assets.signals import on_node_moved
 from assets.serializers import AssetGrantedSerializer, NodeGrantedSerializer, NodeSerializer
 
 
@@ -86,3 +86,25 @@ class NodePermission(models.Model):
     class Meta:
         unique_together = ('node', 'user_group', 'system_user')
         verbose_name = _("Asset permission")
+
+
+class UserAssetGrant(models.Model):
+    """
+    Denormalized (user, asset, system user) rows built from NodePermission,
+    maintained by perms signals handler, so asking what a user is granted
+    is a single indexed lookup instead of walking groups, nodes and assets.
+    date_expired is the latest expiry of the permissions that grant it.
+    """
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True)
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='asset_grants', verbose_name=_("User"))
+    asset = models.ForeignKey('assets.Asset', on_delete=models.CASCADE, related_name='user_grants', verbose_name=_("Asset"))
+    system_user = models.ForeignKey('assets.SystemUser', on_delete=models.CASCADE, related_name='user_grants', verbose_name=_("System user"))
+    date_expired = models.DateTimeField(verbose_name=_('Date expired'))
+
+    def __str__(self):
+        return "{}:{}:{}".format(self.user_id, self.asset_id, self.system_user_id)
+
+    class Meta:
+        unique_together = ('user', 'asset', 'system_user')
+        index_together = ('user', 'date_expired')
+        verbose_name = _("User asset grant")
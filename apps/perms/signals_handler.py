@@ -1,18 +1,168 @@
 # -*- coding: utf-8 -*-
 #
 
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save, \
+    pre_delete, m2m_changed
 from django.dispatch import receiver
+from django.db import transaction
 
 from common.utils import get_logger
 from .models import NodePermission
+from .hands import User, UserGroup, Asset, Node, on_node_moved
+from .utils import UserGrantChecker, AssetGrantIndex
+from .tasks import rebuild_users_grants, rebuild_user_groups_grants, \
+    rebuild_assets_grants, rebuild_node_subtree_grants
 
 
 logger = get_logger(__file__)
 
 
+def delay_on_commit(task, *args):
+    """
+    Rebuild grants in celery after the change committed, large user
+    groups or nodes don't block the request
+    """
+    transaction.on_commit(lambda: task.delay(*args))
+
+
+def revoke_on_commit(revoke, task, *args):
+    """
+    Grants may be revoked by the change, so delete them in this process
+    when the change committed, only granting again waits the celery task
+    """
+    def func():
+        revoke(*args)
+        task.delay(*args)
+    transaction.on_commit(func)
+
+
 @receiver(post_save, sender=NodePermission, dispatch_uid="my_unique_identifier")
 def on_asset_permission_create_or_update(sender, instance=None, **kwargs):
     if instance and instance.node and instance.system_user:
         instance.system_user.nodes.add(instance.node)
 
+
+@receiver(pre_save, sender=NodePermission)
+def on_asset_permission_pre_save(sender, instance=None, **kwargs):
+    # Permission may be moved to other user group, so remember it
+    instance._origin_user_group_id = sender.objects.filter(pk=instance.pk)\
+        .values_list('user_group_id', flat=True).first()
+
+
+@receiver(post_save, sender=NodePermission)
+def on_asset_permission_changed_rebuild_grants(sender, instance=None, created=False, **kwargs):
+    groups_id = {instance.user_group_id, getattr(instance, '_origin_user_group_id', None)}
+    groups_id.discard(None)
+    logger.debug("Permission changed, rebuild user groups grants")
+    if created:
+        delay_on_commit(rebuild_user_groups_grants, list(groups_id))
+    else:
+        revoke_on_commit(
+            AssetGrantIndex.revoke_user_groups, rebuild_user_groups_grants,
+            list(groups_id)
+        )
+
+
+@receiver(post_delete, sender=NodePermission)
+def on_asset_permission_deleted(sender, instance=None, **kwargs):
+    logger.debug("Permission deleted, revoke user group grants")
+    revoke_on_commit(
+        AssetGrantIndex.revoke_user_groups, rebuild_user_groups_grants,
+        [instance.user_group_id]
+    )
+
+
+@receiver(post_save, sender=UserGroup)
+def on_user_group_update(sender, instance=None, created=False, **kwargs):
+    # User group delete only mark it discard
+    if not created:
+        revoke_on_commit(
+            AssetGrantIndex.revoke_user_groups, rebuild_user_groups_grants,
+            [instance.id]
+        )
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def on_user_groups_changed(sender, instance=None, action='', reverse=False,
+                           pk_set=None, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_users_id = list(
+            instance.users.all().values_list('id', flat=True)
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        users_id = [instance.id]
+    elif action == 'post_clear':
+        users_id = getattr(instance, '_cleared_users_id', [])
+    else:
+        users_id = pk_set or []
+    logger.debug("User groups changed, rebuild users grants")
+    if action == 'post_add':
+        delay_on_commit(rebuild_users_grants, list(users_id))
+    else:
+        revoke_on_commit(
+            AssetGrantIndex.revoke_users, rebuild_users_grants, list(users_id)
+        )
+
+
+@receiver(m2m_changed, sender=Asset.nodes.through)
+def on_asset_nodes_changed_rebuild_grants(sender, instance=None, action='',
+                                          reverse=False, pk_set=None, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_assets_id = list(
+            instance.assets.all().values_list('id', flat=True)
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        assets_id = [instance.id]
+    elif action == 'post_clear':
+        assets_id = getattr(instance, '_cleared_assets_id', [])
+    else:
+        assets_id = pk_set or []
+    logger.debug("Asset nodes changed, rebuild assets grants")
+    if action == 'post_add':
+        delay_on_commit(rebuild_assets_grants, list(assets_id))
+    else:
+        revoke_on_commit(
+            AssetGrantIndex.revoke_assets, rebuild_assets_grants, list(assets_id)
+        )
+
+
+@receiver(post_save, sender=Asset)
+def on_asset_saved_expire_grant_checker(sender, instance=None, created=False, **kwargs):
+    # Grants of inactive asset are not cached, activity may be changed
+    if not created:
+        transaction.on_commit(
+            lambda: UserGrantChecker.expire_assets([instance.id])
+        )
+
+
+@receiver(on_node_moved)
+def on_node_moved_rebuild_grants(sender, node=None, old_key=None, new_key=None, **kwargs):
+    logger.debug("Node moved {} => {}, rebuild subtree grants".format(
+        old_key, new_key
+    ))
+    revoke_on_commit(
+        AssetGrantIndex.revoke_node_subtree, rebuild_node_subtree_grants, new_key
+    )
+
+
+@receiver(pre_delete, sender=Node)
+def on_node_pre_delete(sender, instance=None, **kwargs):
+    instance._origin_assets_id = list(
+        instance.assets.all().values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Node)
+def on_node_deleted(sender, instance=None, **kwargs):
+    revoke_on_commit(
+        AssetGrantIndex.revoke_assets, rebuild_assets_grants,
+        getattr(instance, '_origin_assets_id', [])
+    )
@@ -3,8 +3,40 @@ from __future__ import absolute_import, unicode_literals
 
 from celery import shared_task
 from common.utils import get_logger, encrypt_password
+from common.celery import register_as_period_task, after_app_ready_start, \
+    after_app_shutdown_clean
+from .utils import AssetGrantIndex
 
 logger = get_logger(__file__)
 
 
+@shared_task
+@register_as_period_task(interval=3600*24)
+@after_app_ready_start
+@after_app_shutdown_clean
+def rebuild_asset_grant_index_period():
+    """
+    Rebuild the whole user asset grant index, also clean expired grants
+    """
+    logger.debug("Rebuild user asset grant index")
+    AssetGrantIndex.rebuild_all()
 
+
+@shared_task
+def rebuild_users_grants(users_id):
+    AssetGrantIndex.rebuild_users(users_id)
+
+
+@shared_task
+def rebuild_user_groups_grants(groups_id):
+    AssetGrantIndex.rebuild_user_groups(groups_id)
+
+
+@shared_task
+def rebuild_assets_grants(assets_id):
+    AssetGrantIndex.rebuild_assets(assets_id)
+
+
+@shared_task
+def rebuild_node_subtree_grants(node_key):
+    AssetGrantIndex.rebuild_node_subtree(node_key)
@@ -1,4 +1,113 @@
-from django.test import TestCase
+import uuid
+import datetime
+
+from django.test import TestCase, SimpleTestCase
+from django.urls import reverse
 
 from django.contrib.sessions.backends import file, db, cache
-from django.contrib.auth.views import login
\ No newline at end of file
+from django.contrib.auth.views import login
+
+from .utils import AssetGrantIndex
+
+
+class TestAssetGrantIndexBuildGrants(SimpleTestCase):
+    def setUp(self):
+        self.expired = datetime.datetime(2030, 1, 1)
+        self.memberships = [('u1', 'g1'), ('u2', 'g1'), ('u3', 'g2')]
+
+    def test_key_ancestors(self):
+        self.assertEqual(
+            AssetGrantIndex.get_key_ancestors('0:1:2'), ['0', '0:1', '0:1:2']
+        )
+        self.assertEqual(AssetGrantIndex.get_key_ancestors('1:2'), ['0', '1', '1:2'])
+
+    def test_grant_by_ancestor_node(self):
+        asset_nodes = [('a1', '0:1:2'), ('a2', '0:3')]
+        permissions = [('0:1', 'g1', 's1', self.expired)]
+        grants = AssetGrantIndex.build_grants(
+            asset_nodes, permissions, self.memberships
+        )
+        self.assertEqual(grants, {
+            ('u1', 'a1', 's1'): self.expired,
+            ('u2', 'a1', 's1'): self.expired,
+        })
+
+    def test_root_grant_all_assets(self):
+        asset_nodes = [('a1', '0:1'), ('a2', '0:3')]
+        permissions = [('0', 'g2', 's1', self.expired)]
+        grants = AssetGrantIndex.build_grants(
+            asset_nodes, permissions, self.memberships
+        )
+        self.assertEqual(set(grants), {('u3', 'a1', 's1'), ('u3', 'a2', 's1')})
+
+    def test_latest_expired_kept(self):
+        later = self.expired + datetime.timedelta(days=1)
+        asset_nodes = [('a1', '0:1'), ('a1', '0:2')]
+        permissions = [
+            ('0:1', 'g2', 's1', self.expired), ('0:2', 'g2', 's1', later),
+        ]
+        grants = AssetGrantIndex.build_grants(
+            asset_nodes, permissions, self.memberships
+        )
+        self.assertEqual(grants, {('u3', 'a1', 's1'): later})
+
+    def test_group_without_users(self):
+        asset_nodes = [('a1', '0:1')]
+        permissions = [('0:1', 'g3', 's1', self.expired)]
+        grants = AssetGrantIndex.build_grants(
+            asset_nodes, permissions, self.memberships
+        )
+        self.assertEqual(grants, {})
+
+
+class TestValidateUserAssetPermissionApi(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        from users.models import User
+        self.user = User.objects.create(
+            username='admin', name='admin', email='', role=User.ROLE_ADMIN
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('api-perms:validate-user-asset-permission')
+        self.bulk_url = reverse('api-perms:validate-user-asset-permission-bulk')
+
+    def validate(self, user_id, asset_id, system_user_id):
+        return self.client.get(self.url, {
+            'user_id': user_id, 'asset_id': asset_id,
+            'system_user_id': system_user_id,
+        })
+
+    def test_bad_id(self):
+        response = self.validate('bad', uuid.uuid4(), uuid.uuid4())
+        self.assertEqual(response.status_code, 404)
+
+    def test_unknown_user(self):
+        response = self.validate(uuid.uuid4(), uuid.uuid4(), uuid.uuid4())
+        self.assertEqual(response.status_code, 404)
+
+    def test_not_granted(self):
+        response = self.validate(self.user.id, uuid.uuid4(), uuid.uuid4())
+        self.assertEqual(response.status_code, 403)
+
+    def test_bulk_not_list(self):
+        response = self.client.post(self.bulk_url, {'user_id': ''}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.bulk_url, ['bad'], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_keep_order(self):
+        items = [
+            {'user_id': str(self.user.id), 'asset_id': str(uuid.uuid4()),
+             'system_user_id': str(uuid.uuid4())},
+            {'user_id': 'bad', 'asset_id': '', 'system_user_id': ''},
+            {'user_id': str(uuid.uuid4()), 'asset_id': str(uuid.uuid4()),
+             'system_user_id': str(uuid.uuid4())},
+        ]
+        response = self.client.post(self.bulk_url, items, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['user_id'] for item in response.data],
+            [item['user_id'] for item in items],
+        )
+        self.assertEqual([item['msg'] for item in response.data], [False] * 3)
@@ -25,6 +25,7 @@ urlpatterns = [
 
     # 验证用户是否有某个资产和系统用户的权限
     url(r'v1/asset-permission/user/validate/$', api.ValidateUserAssetPermissionView.as_view(), name='validate-user-asset-permission'),
+    url(r'v1/asset-permission/user/validate/bulk/$', api.ValidateUserAssetPermissionBulkView.as_view(), name='validate-user-asset-permission-bulk'),
 ]
 
 urlpatterns += router.urls
@@ -2,12 +2,17 @@
 
 from __future__ import absolute_import, unicode_literals
 import collections
+import time
 from django.utils import timezone
 from django.utils.translation import ugettext as _
+from django.db import transaction
+from django.db.models import Q
+from django.core.cache import cache
 import copy
 
-from common.utils import setattr_bulk, get_logger
-from .models import NodePermission
+from common.utils import setattr_bulk, get_logger, get_short_uuid_str
+from .models import NodePermission, UserAssetGrant
+from .hands import User, Asset
 
 logger = get_logger(__file__)
 
@@ -94,13 +99,7 @@ class NodePermissionUtil:
 
     @classmethod
     def get_user_assets(cls, user):
-        assets = collections.defaultdict(set)
-        nodes_with_assets = cls.get_user_nodes_with_assets(user)
-
-        for v in nodes_with_assets.values():
-            for asset in v['assets']:
-                assets[asset].update(v['system_users'])
-        return assets
+        return AssetGrantIndex.get_user_assets(user)
 
     @classmethod
     def get_system_user_assets(cls, system_user):
@@ -111,3 +110,347 @@ class NodePermissionUtil:
             assets.update(perm.node.get_all_assets())
         return assets
 
+
+
+class AssetGrantIndex:
+    """
+    Maintain the UserAssetGrant table, rebuild rows of some users or some
+    assets when permission, user group or node membership changed.
+    """
+    model = UserAssetGrant
+    chunk_size = 500
+    # Users have no grant rows may be built, so mark it explicitly
+    BUILT_CACHE_KEY = "PERMS_USER_GRANT_INDEX_BUILT_{}"
+
+    @classmethod
+    def mark_users_built(cls, users_id):
+        data = {cls.BUILT_CACHE_KEY.format(user_id): 1 for user_id in users_id}
+        if data:
+            cache.set_many(data, None)
+
+    @classmethod
+    def is_user_built(cls, user_id):
+        return cache.get(cls.BUILT_CACHE_KEY.format(user_id)) is not None
+
+    @staticmethod
+    def on_commit(func, *args):
+        transaction.on_commit(lambda: func(*args))
+
+    @staticmethod
+    def get_key_ancestors(key):
+        """
+        :param key: '0:1:2'
+        :return: ['0', '0:1', '0:1:2']
+        """
+        parts = key.split(':')
+        keys = [':'.join(parts[:i]) for i in range(1, len(parts)+1)]
+        if '0' not in keys:
+            keys.insert(0, '0')
+        return keys
+
+    @staticmethod
+    def get_valid_permissions():
+        return NodePermission.objects.filter(
+            is_active=True, date_expired__gt=timezone.now()
+        ).values_list('node__key', 'user_group_id', 'system_user_id', 'date_expired')
+
+    @staticmethod
+    def get_memberships():
+        through = User.groups.through
+        return through.objects.filter(usergroup__is_discard=False)\
+            .values_list('user_id', 'usergroup_id')
+
+    @staticmethod
+    def get_asset_nodes():
+        return Asset.nodes.through.objects.all().values_list('asset_id', 'node__key')
+
+    @classmethod
+    def build_grants(cls, asset_nodes, permissions, memberships):
+        """
+        :param asset_nodes: [(asset_id, node_key), ..]
+        :param permissions: [(node_key, user_group_id, system_user_id, date_expired), ..]
+        :param memberships: [(user_id, user_group_id), ..]
+        :return: {(user_id, asset_id, system_user_id): date_expired}
+        """
+        group_users = collections.defaultdict(set)
+        for user_id, group_id in memberships:
+            group_users[group_id].add(user_id)
+
+        key_permissions = collections.defaultdict(list)
+        for key, group_id, system_user_id, date_expired in permissions:
+            if group_users.get(group_id):
+                key_permissions[key].append((group_id, system_user_id, date_expired))
+
+        grants = {}
+        if not key_permissions:
+            return grants
+        for asset_id, node_key in asset_nodes:
+            for key in cls.get_key_ancestors(node_key):
+                for group_id, system_user_id, date_expired in key_permissions.get(key, []):
+                    for user_id in group_users[group_id]:
+                        k = (user_id, asset_id, system_user_id)
+                        if k not in grants or grants[k] < date_expired:
+                            grants[k] = date_expired
+        return grants
+
+    @classmethod
+    def save_grants(cls, grants):
+        objs = [
+            cls.model(user_id=user_id, asset_id=asset_id,
+                      system_user_id=system_user_id, date_expired=date_expired)
+            for (user_id, asset_id, system_user_id), date_expired in grants.items()
+        ]
+        cls.model.objects.bulk_create(objs, batch_size=cls.chunk_size)
+
+    @classmethod
+    def rebuild_users(cls, users_id):
+        users_id = list(set(users_id))
+        for i in range(0, len(users_id), cls.chunk_size):
+            chunk = users_id[i:i+cls.chunk_size]
+            memberships = list(cls.get_memberships().filter(user_id__in=chunk))
+            groups_id = {group_id for _, group_id in memberships}
+            permissions = list(
+                cls.get_valid_permissions().filter(user_group_id__in=groups_id)
+            )
+            keys = {key for key, *_ in permissions}
+            asset_nodes = cls.get_asset_nodes()
+            if not keys:
+                asset_nodes = []
+            elif '0' not in keys:
+                q = Q(node__key__in=keys)
+                for key in keys:
+                    q |= Q(node__key__startswith='{}:'.format(key))
+                asset_nodes = asset_nodes.filter(q)
+            grants = cls.build_grants(asset_nodes, permissions, memberships)
+            with transaction.atomic():
+                cls.model.objects.filter(user_id__in=chunk).delete()
+                cls.save_grants(grants)
+            cls.on_commit(cls.mark_users_built, chunk)
+            cls.on_commit(UserGrantChecker.expire, chunk)
+            logger.debug("Rebuild {} users asset grants: {}".format(
+                len(chunk), len(grants))
+            )
+
+    @classmethod
+    def rebuild_assets(cls, assets_id):
+        assets_id = list(set(assets_id))
+        for i in range(0, len(assets_id), cls.chunk_size):
+            chunk = assets_id[i:i+cls.chunk_size]
+            asset_nodes = list(cls.get_asset_nodes().filter(asset_id__in=chunk))
+            keys = set()
+            for _, node_key in asset_nodes:
+                keys.update(cls.get_key_ancestors(node_key))
+            permissions = list(cls.get_valid_permissions().filter(node__key__in=keys))
+            groups_id = {group_id for _, group_id, *_ in permissions}
+            memberships = cls.get_memberships().filter(usergroup_id__in=groups_id)
+            grants = cls.build_grants(asset_nodes, permissions, memberships)
+            grants_old = cls.model.objects.filter(asset_id__in=chunk)
+            users_id = set(grants_old.values_list('user_id', flat=True))
+            users_id.update(user_id for user_id, *_ in grants)
+            with transaction.atomic():
+                grants_old.delete()
+                cls.save_grants(grants)
+            cls.on_commit(UserGrantChecker.expire, users_id)
+            logger.debug("Rebuild {} assets grants: {}".format(
+                len(chunk), len(grants))
+            )
+
+    @classmethod
+    def rebuild_user_groups(cls, groups_id):
+        through = User.groups.through
+        users_id = through.objects.filter(usergroup_id__in=groups_id)\
+            .values_list('user_id', flat=True)
+        cls.rebuild_users(users_id)
+
+    @classmethod
+    def rebuild_node_subtree(cls, node_key):
+        assets_id = Asset.nodes.through.objects.filter(
+            Q(node__key=node_key) | Q(node__key__startswith='{}:'.format(node_key))
+        ).values_list('asset_id', flat=True)
+        cls.rebuild_assets(assets_id)
+
+    @classmethod
+    def rebuild_all(cls):
+        """
+        Rebuild in one transaction, so the old grants are seen until the
+        new ones committed
+        """
+        users_id = list(User.objects.all().values_list('id', flat=True))
+        with transaction.atomic():
+            cls.model.objects.all().delete()
+            cls.rebuild_users(users_id)
+
+    @classmethod
+    def revoke_users(cls, users_id):
+        """
+        Delete grants of the users at once, not waiting the celery rebuild.
+        They are not marked built, so grants of a user are rebuilt when it
+        is used, if the rebuild task not run yet
+        """
+        users_id = list(set(users_id))
+        for i in range(0, len(users_id), cls.chunk_size):
+            chunk = users_id[i:i+cls.chunk_size]
+            cls.model.objects.filter(user_id__in=chunk).delete()
+            cache.delete_many([cls.BUILT_CACHE_KEY.format(i) for i in chunk])
+            UserGrantChecker.expire(chunk)
+
+    @classmethod
+    def revoke_assets(cls, assets_id):
+        assets_id = list(set(assets_id))
+        for i in range(0, len(assets_id), cls.chunk_size):
+            chunk = assets_id[i:i+cls.chunk_size]
+            grants = cls.model.objects.filter(asset_id__in=chunk)
+            users_id = set(grants.values_list('user_id', flat=True))
+            cls.revoke_users(users_id)
+
+    @classmethod
+    def revoke_user_groups(cls, groups_id):
+        through = User.groups.through
+        users_id = through.objects.filter(usergroup_id__in=groups_id)\
+            .values_list('user_id', flat=True)
+        cls.revoke_users(users_id)
+
+    @classmethod
+    def revoke_node_subtree(cls, node_key):
+        assets_id = Asset.nodes.through.objects.filter(
+            Q(node__key=node_key) | Q(node__key__startswith='{}:'.format(node_key))
+        ).values_list('asset_id', flat=True)
+        cls.revoke_assets(assets_id)
+
+    @classmethod
+    def get_user_grants(cls, user):
+        user_id = getattr(user, 'id', user)
+        # Index may be not built for this user yet, so build it first
+        if not cls.is_user_built(user_id):
+            cls.rebuild_users([user_id])
+        return cls.model.objects.filter(
+            user_id=user_id, date_expired__gt=timezone.now(), asset__is_active=True,
+        )
+
+    @classmethod
+    def get_user_assets_id(cls, user):
+        return cls.get_user_grants(user).values_list('asset_id', flat=True)
+
+    @classmethod
+    def get_user_assets(cls, user):
+        """
+        :return: {asset: set(system_user1, ..), ..}
+        """
+        assets = collections.defaultdict(set)
+        grants = cls.get_user_grants(user).select_related('asset', 'system_user')
+        for grant in grants:
+            assets[grant.asset].add(grant.system_user)
+        return assets
+
+
+class UserGrantChecker:
+    """
+    Check user has permission of (asset, system user) in constant time.
+    Every grant of a user is cached as one key under the user's version,
+    expire a user's cache only need delete his version key. Grants of
+    inactive assets are not cached, so asset activity is checked too.
+
+    Grants written under a version are used only when the ready key of the
+    version is set, it's set only if the version is still the same after
+    the grants are loaded and written, so a build racing with `expire`
+    never publish a stale grant set.
+    """
+    VERSION_CACHE_KEY = "PERMS_USER_GRANT_VERSION_{}"
+    READY_CACHE_KEY = "PERMS_USER_GRANT_READY_{}_{}"
+    GRANT_CACHE_KEY = "PERMS_USER_GRANT_{}_{}_{}_{}"
+    CACHE_TIME = 3600 * 24
+
+    @classmethod
+    def get_grant_cache_key(cls, user_id, version, asset_id, system_user_id):
+        return cls.GRANT_CACHE_KEY.format(user_id, version, asset_id, system_user_id)
+
+    @classmethod
+    def get_version(cls, user_id):
+        key = cls.VERSION_CACHE_KEY.format(user_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, get_short_uuid_str(), cls.CACHE_TIME)
+            version = cache.get(key)
+        return version
+
+    @classmethod
+    def build(cls, user_id):
+        """
+        :return: {(asset_id, system_user_id): date_expired timestamp}, or
+            None if the user not exist
+        """
+        if not User.objects.filter(id=user_id).exists():
+            return None
+        version = cls.get_version(user_id)
+        grants = AssetGrantIndex.get_user_grants(user_id)\
+            .values_list('asset_id', 'system_user_id', 'date_expired')
+        grants = {
+            (asset_id, system_user_id): date_expired.timestamp()
+            for asset_id, system_user_id, date_expired in grants
+        }
+        data = {
+            cls.get_grant_cache_key(user_id, version, asset_id, system_user_id): v
+            for (asset_id, system_user_id), v in grants.items()
+        }
+        if data:
+            cache.set_many(data, cls.CACHE_TIME)
+        # Compare and set, grants may be stale if version changed
+        if cache.get(cls.VERSION_CACHE_KEY.format(user_id)) == version:
+            cache.set(cls.READY_CACHE_KEY.format(user_id, version), 1, cls.CACHE_TIME)
+        return grants
+
+    @classmethod
+    def expire(cls, users_id):
+        keys = [cls.VERSION_CACHE_KEY.format(user_id) for user_id in users_id]
+        if keys:
+            cache.delete_many(keys)
+
+    @classmethod
+    def expire_assets(cls, assets_id):
+        users_id = UserAssetGrant.objects.filter(asset_id__in=assets_id)\
+            .values_list('user_id', flat=True).distinct()
+        cls.expire(users_id)
+
+    @classmethod
+    def get_cached(cls, user_id, items):
+        """
+        :return: {(asset_id, system_user_id): date_expired timestamp} of
+            the items, or None if grants of the user not cached
+        """
+        version = cache.get(cls.VERSION_CACHE_KEY.format(user_id))
+        if version is None:
+            return None
+        ready_key = cls.READY_CACHE_KEY.format(user_id, version)
+        keys = {}
+        for asset_id, system_user_id in items:
+            key = cls.get_grant_cache_key(user_id, version, asset_id, system_user_id)
+            keys[key] = (asset_id, system_user_id)
+        values = cache.get_many([ready_key] + list(keys.keys()))
+        if ready_key not in values:
+            return None
+        return {item: values[key] for key, item in keys.items() if key in values}
+
+    @classmethod
+    def has_perms(cls, user_id, items):
+        """
+        Check a user many (asset, system user) once
+        :param items: [(asset_id, system_user_id), ..]
+        :return: [True, False, ..] same order as items, None if user not exist
+        """
+        grants = cls.get_cached(user_id, items)
+        if grants is None:
+            grants = cls.build(user_id)
+        if grants is None:
+            return None
+        now = time.time()
+        return [grants.get(item, 0) > now for item in items]
+
+    @classmethod
+    def has_perm(cls, user_id, asset_id, system_user_id):
+        """
+        :return: True or False, None if user not exist
+        """
+        verdicts = cls.has_perms(user_id, [(asset_id, system_user_id)])
+        if verdicts is None:
+            return None
+        return verdicts[0]
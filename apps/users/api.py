@@ -12,7 +12,7 @@ from rest_framework_bulk import BulkModelViewSet
 from .serializers import UserSerializer, UserGroupSerializer, \
     UserGroupUpdateMemeberSerializer, UserPKUpdateSerializer, \
     UserUpdateGroupSerializer, ChangeUserPasswordSerializer
-from .tasks import write_login_log_async
+from .utils import write_login_log_buffered
 from .models import User, UserGroup
 from .permissions import IsSuperUser, IsValidUser, IsCurrentUserOrReadOnly, \
     IsSuperUserOrAppUser
@@ -158,7 +158,7 @@ class UserAuthApi(APIView):
 
         if user:
             token = generate_token(request, user)
-            write_login_log_async.delay(
+            write_login_log_buffered(
                 user.username, ip=login_ip,
                 type=login_type, user_agent=user_agent,
             )
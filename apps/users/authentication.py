@@ -6,7 +6,6 @@ import uuid
 import hashlib
 import time
 
-from django.core.cache import cache
 from django.conf import settings
 from django.utils.translation import ugettext as _
 from django.utils.six import text_type
@@ -15,8 +14,9 @@ from rest_framework import HTTP_HEADER_ENCODING
 from rest_framework import authentication, exceptions, permissions
 from rest_framework.authentication import CSRFCheck
 
-from common.utils import get_object_or_none, make_signature, http_to_unixtime
-from .utils import refresh_token
+from common.utils import make_signature, http_to_unixtime
+from .utils import get_token_user, get_access_key_auth_info, \
+    check_access_key_nonce
 from .models import User, AccessKey, PrivateToken
 
 
@@ -84,11 +84,12 @@ class AccessKeyAuthentication(authentication.BaseAuthentication):
 
     @staticmethod
     def authenticate_credentials(request, access_key_id, request_signature):
-        access_key = get_object_or_none(AccessKey, id=access_key_id)
+        auth_info = get_access_key_auth_info(access_key_id)
         request_date = get_request_date_header(request)
-        if access_key is None or not access_key.user:
+        if auth_info is None:
             raise exceptions.AuthenticationFailed(_('Invalid signature.'))
-        access_key_secret = access_key.secret
+        access_key_secret = auth_info['secret']
+        user = auth_info['user']
 
         try:
             request_unix_time = http_to_unixtime(request_date)
@@ -105,9 +106,13 @@ class AccessKeyAuthentication(authentication.BaseAuthentication):
         if not signature == request_signature:
             raise exceptions.AuthenticationFailed(_('Invalid signature.'))
 
-        if not access_key.user.is_active:
+        if not user.is_active:
             raise exceptions.AuthenticationFailed(_('User disabled.'))
-        return access_key.user, None
+
+        if settings.ACCESS_KEY_NONCE_CHECK and \
+                not check_access_key_nonce(access_key_id, request_signature):
+            raise exceptions.AuthenticationFailed(_('Signature has been used.'))
+        return user, None
 
 
 class AccessTokenAuthentication(authentication.BaseAuthentication):
@@ -138,13 +143,11 @@ class AccessTokenAuthentication(authentication.BaseAuthentication):
 
     @staticmethod
     def authenticate_credentials(token):
-        user_id = cache.get(token)
-        user = get_object_or_none(User, id=user_id)
+        user = get_token_user(token)
 
         if not user:
             msg = _('Invalid token or cache refreshed.')
             raise exceptions.AuthenticationFailed(msg)
-        refresh_token(token, user)
         return user, None
 
 
@@ -4,6 +4,7 @@
 
 import uuid
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from rest_framework.authtoken.models import Token
 from .user import User
@@ -47,7 +48,18 @@ class LoginLog(models.Model):
     ip = models.GenericIPAddressField(verbose_name=_('Login ip'))
     city = models.CharField(max_length=254, blank=True, null=True, verbose_name=_('Login city'))
     user_agent = models.CharField(max_length=254, blank=True, null=True, verbose_name=_('User agent'))
-    datetime = models.DateTimeField(auto_now_add=True, verbose_name=_('Date login'))
+    datetime = models.DateTimeField(default=timezone.now, db_index=True, verbose_name=_('Date login'))
+    # Local date of the login, the bucket range query and retention using
+    date = models.DateField(null=True, blank=True, verbose_name=_('Date'))
+
+    def save(self, *args, **kwargs):
+        if self.date is None:
+            self.date = timezone.localtime(self.datetime).date()
+        return super().save(*args, **kwargs)
 
     class Meta:
         ordering = ['-datetime', 'username']
+        index_together = [
+            ('date', 'username'),
+            ('username', 'datetime'),
+        ]
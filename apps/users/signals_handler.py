@@ -2,10 +2,11 @@
 #
 
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 
 from common.utils import get_logger
-from .models import User
+from .models import User, AccessKey
 
 logger = get_logger(__file__)
 
@@ -17,4 +18,38 @@ def on_user_created(sender, instance=None, created=False, **kwargs):
         from .utils import send_user_created_mail
         logger.info("   - Sending welcome mail ...".format(instance.name))
         if instance.email:
-            send_user_created_mail(instance)
\ No newline at end of file
+            send_user_created_mail(instance)
+
+
+@receiver(post_save, sender=User)
+def on_user_changed_expire_access_keys(sender, instance=None, created=False, **kwargs):
+    if created:
+        return
+    from .utils import expire_access_keys_auth_info
+    access_keys_id = list(instance.access_key.all().values_list('id', flat=True))
+    # Expire after commit, or other request may cache the old user again
+    transaction.on_commit(lambda: expire_access_keys_auth_info(access_keys_id))
+
+
+@receiver(post_save, sender=User)
+def on_user_changed_refresh_token_sessions(sender, instance=None, created=False, **kwargs):
+    if created:
+        return
+    from .utils import refresh_user_token_sessions
+    # Refresh after commit, or sessions may get the user not committed
+    transaction.on_commit(lambda: refresh_user_token_sessions(instance))
+
+
+@receiver(post_delete, sender=User)
+def on_user_deleted(sender, instance=None, **kwargs):
+    from .utils import delete_user_token_sessions
+    # The pk of instance is cleared after deleted, keep it for on commit
+    user_id = instance.id
+    transaction.on_commit(lambda: delete_user_token_sessions(user_id))
+
+
+@receiver(post_delete, sender=AccessKey)
+def on_access_key_deleted(sender, instance=None, **kwargs):
+    from .utils import expire_access_keys_auth_info
+    access_key_id = instance.id
+    transaction.on_commit(lambda: expire_access_keys_auth_info([access_key_id]))
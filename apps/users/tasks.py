@@ -1,11 +1,68 @@
 # -*- coding: utf-8 -*-
 #
 
+import datetime
+
 from celery import shared_task
-from .utils import write_login_log
+from django.conf import settings
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from common.utils import get_logger
+from common.celery import register_as_period_task, after_app_ready_start, \
+    after_app_shutdown_clean
+from .models import LoginLog
+from .utils import write_queued_login_logs
+
+logger = get_logger(__file__)
+
+
+@shared_task
+def write_queued_login_logs_async():
+    write_queued_login_logs()
 
 
 @shared_task
-def write_login_log_async(*args, **kwargs):
-    write_login_log(*args, **kwargs)
+@register_as_period_task(interval=settings.LOGIN_LOG_FLUSH_INTERVAL)
+@after_app_ready_start
+@after_app_shutdown_clean
+def write_queued_login_logs_period():
+    count = write_queued_login_logs()
+    if count:
+        logger.debug("Write {} queued login logs".format(count))
+
+
+def fill_login_log_date(chunk_size=10000):
+    """
+    Fill the date of logs written before it's added, in chunks so the
+    update never lock the whole table. Login logs list query by date only
+    """
+    count = 0
+    while True:
+        logs_id = list(
+            LoginLog.objects.filter(date=None)
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if not logs_id:
+            break
+        LoginLog.objects.filter(id__in=logs_id)\
+            .update(date=TruncDate('datetime'))
+        count += len(logs_id)
+    if count:
+        logger.info("Fill date of {} login logs".format(count))
+    return count
 
+
+@shared_task
+@register_as_period_task(interval=3600*24)
+@after_app_ready_start
+@after_app_shutdown_clean
+def clean_login_log_period():
+    """
+    Fill the date bucket of old login logs, delete logs out of keep days
+    """
+    fill_login_log_date()
+    date_expired = timezone.localtime(timezone.now()).date() - \
+        datetime.timedelta(days=settings.LOGIN_LOG_KEEP_DAYS)
+    count, _ = LoginLog.objects.filter(date__lt=date_expired).delete()
+    logger.info("Delete {} expired login logs".format(count))
@@ -0,0 +1,75 @@
+import uuid
+
+from django.test import TestCase
+from django.core.cache import cache
+
+from ..models import User, AccessKey
+from ..utils import get_access_key_auth_info, expire_access_keys_auth_info, \
+    ACCESS_KEY_CACHE_KEY, refresh_token, add_user_token, get_user_tokens, \
+    get_token_user, refresh_user_token_sessions, delete_user_token_sessions
+
+
+class TestAccessKeyAuthInfo(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test', name='test', email='')
+        self.user.set_password('password')
+        self.user.save()
+        self.access_key = AccessKey.objects.create(user=self.user)
+        self.addCleanup(expire_access_keys_auth_info, [self.access_key.id])
+
+    def test_cached_without_secrets(self):
+        info = get_access_key_auth_info(self.access_key.id)
+        self.assertEqual(info['secret'], self.access_key.get_secret())
+        self.assertEqual(info['user'].id, self.user.id)
+        cached = cache.get(ACCESS_KEY_CACHE_KEY.format(self.access_key.id))
+        self.assertNotIn('password', cached['user'])
+        # Fields not in the snapshot are loaded from db when accessed
+        self.assertTrue(info['user'].check_password('password'))
+
+    def test_expire(self):
+        get_access_key_auth_info(self.access_key.id)
+        expire_access_keys_auth_info([self.access_key.id])
+        self.assertIsNone(cache.get(ACCESS_KEY_CACHE_KEY.format(self.access_key.id)))
+
+    def test_unknown_access_key(self):
+        self.assertIsNone(get_access_key_auth_info(uuid.uuid4()))
+
+
+class TestUserTokenSessions(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test', name='test', email='')
+        self.addCleanup(delete_user_token_sessions, self.user.id)
+
+    def login(self):
+        token = uuid.uuid4().hex
+        refresh_token(token, self.user)
+        add_user_token(token, self.user)
+        return token
+
+    def test_tokens_recorded(self):
+        tokens = [self.login(), self.login()]
+        self.assertEqual(set(get_user_tokens(self.user.id)), set(tokens))
+        # Expired token is dropped when others added
+        cache.delete(tokens[0])
+        token = self.login()
+        self.assertEqual(set(get_user_tokens(self.user.id)), {tokens[1], token})
+
+    def test_token_user(self):
+        token = self.login()
+        user = get_token_user(token)
+        self.assertEqual(user.id, self.user.id)
+        self.assertNotIn('password', cache.get(token)['user'])
+        self.assertIsNone(get_token_user(uuid.uuid4().hex))
+
+    def test_refresh_sessions(self):
+        tokens = [self.login(), self.login()]
+        self.user.name = 'renamed'
+        refresh_user_token_sessions(self.user)
+        for token in tokens:
+            self.assertEqual(get_token_user(token).name, 'renamed')
+
+    def test_delete_sessions(self):
+        token = self.login()
+        delete_user_token_sessions(self.user.id)
+        self.assertIsNone(get_token_user(token))
+        self.assertEqual(get_user_tokens(self.user.id), [])
@@ -0,0 +1,55 @@
+import uuid
+import datetime
+from unittest import mock
+
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.utils.timezone import utc
+
+from common.utils import get_redis_client
+from ..models import LoginLog
+from ..views.login import LoginLogListView
+from ..utils import write_login_log_buffered, write_queued_login_logs, \
+    LOGIN_LOG_QUEUE_KEY, LOGIN_LOG_DEAD_QUEUE_KEY
+
+
+class LoginLogStub:
+    def __init__(self, dt):
+        self.id = uuid.uuid4()
+        self.datetime = dt
+
+
+class TestLoginLogCursor(SimpleTestCase):
+    def test_make_and_parse(self):
+        dt = datetime.datetime(2018, 3, 1, 10, 20, 30, 123456, tzinfo=utc)
+        log = LoginLogStub(dt)
+        cursor = LoginLogListView.make_cursor(log)
+        self.assertEqual(LoginLogListView.parse_cursor(cursor), (dt, log.id))
+
+    def test_parse_bad_cursor(self):
+        for cursor in (None, '', 'abc', '123', '123_bad', 'abc_{}'.format(uuid.uuid4())):
+            self.assertIsNone(LoginLogListView.parse_cursor(cursor))
+
+
+class TestWriteQueuedLoginLogs(TestCase):
+    def setUp(self):
+        self.redis = get_redis_client()
+        self.redis.delete(LOGIN_LOG_QUEUE_KEY, LOGIN_LOG_DEAD_QUEUE_KEY)
+        self.addCleanup(self.redis.delete, LOGIN_LOG_QUEUE_KEY, LOGIN_LOG_DEAD_QUEUE_KEY)
+
+    def test_bad_item_skipped(self):
+        self.redis.rpush(LOGIN_LOG_QUEUE_KEY, b'bad')
+        write_login_log_buffered('test', type='W', ip='127.0.0.1')
+        self.assertEqual(write_queued_login_logs(), 1)
+        self.assertTrue(LoginLog.objects.filter(username='test').exists())
+        self.assertEqual(self.redis.lrange(LOGIN_LOG_DEAD_QUEUE_KEY, 0, -1), [b'bad'])
+        self.assertEqual(self.redis.llen(LOGIN_LOG_QUEUE_KEY), 0)
+
+    @override_settings(LOGIN_LOG_MAX_RETRIES=1)
+    def test_retries_limited(self):
+        write_login_log_buffered('test', type='W', ip='127.0.0.1')
+        with mock.patch('users.utils.write_login_logs', side_effect=Exception('db down')):
+            write_queued_login_logs()
+            self.assertEqual(self.redis.llen(LOGIN_LOG_QUEUE_KEY), 1)
+            write_queued_login_logs()
+        self.assertEqual(self.redis.llen(LOGIN_LOG_QUEUE_KEY), 0)
+        self.assertEqual(self.redis.llen(LOGIN_LOG_DEAD_QUEUE_KEY), 1)
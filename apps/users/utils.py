@@ -1,24 +1,35 @@
 # ~*~ coding: utf-8 ~*~
 #
 from __future__ import unicode_literals
+import os
+import json
 import base64
+import datetime
 import logging
+import time
 import uuid
+from functools import lru_cache
 
-import requests
 import ipaddress
 from django.conf import settings
+try:
+    import geoip2.database
+    import geoip2.errors
+except ImportError:
+    geoip2 = None
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib.auth import authenticate, login as auth_login
 from django.utils.translation import ugettext as _
 from django.core.cache import cache
+from django.utils import timezone
 
 from common.tasks import send_mail_async
-from common.utils import reverse, get_object_or_none
-from .models import User, LoginLog
+from common.utils import reverse, get_object_or_none, get_redis_client
+from .models import User, LoginLog, AccessKey
 
 
 logger = logging.getLogger('jumpserver')
+_geoip_reader = None
 
 
 class AdminUserRequiredMixin(UserPassesTestMixin):
@@ -154,8 +165,139 @@ def check_user_valid(**kwargs):
     return None, _('Password or SSH public key invalid')
 
 
+ACCESS_KEY_CACHE_KEY = 'ACCESS_KEY_{}'
+ACCESS_KEY_NONCE_CACHE_KEY = 'ACCESS_KEY_NONCE_{}_{}'
+
+
+def get_access_key_auth_info(access_key_id):
+    """
+    Get the secret and user of access key, cached for a while, so
+    the signature auth need no query. The user is cached as the snapshot,
+    secrets of the user are not in it
+    :return: {"secret": "", "user": user} or None
+    """
+    key = ACCESS_KEY_CACHE_KEY.format(access_key_id)
+    info = cache.get(key)
+    if info is None:
+        access_key = AccessKey.objects.filter(id=access_key_id)\
+            .select_related('user').first()
+        if access_key is None or not access_key.user:
+            return None
+        info = {
+            'secret': access_key.get_secret(),
+            'user': get_user_snapshot(access_key.user),
+        }
+        cache.set(key, info, settings.ACCESS_KEY_CACHE_TTL)
+    return {'secret': info['secret'], 'user': load_user_snapshot(info['user'])}
+
+
+def expire_access_keys_auth_info(access_keys_id):
+    keys = [ACCESS_KEY_CACHE_KEY.format(i) for i in access_keys_id]
+    if keys:
+        cache.delete_many(keys)
+
+
+def check_access_key_nonce(access_key_id, signature, timeout=15*60):
+    """
+    Signature can be used only once in the timeout window
+    """
+    key = ACCESS_KEY_NONCE_CACHE_KEY.format(access_key_id, signature)
+    return cache.add(key, 1, timeout)
+
+
+USER_TOKENS_CACHE_KEY = 'USER_TOKENS_{}'
+# Secret and large fields are not in the snapshot, loaded when accessed
+USER_SNAPSHOT_EXCLUDE_FIELDS = (
+    'password', 'secret_key_otp', '_private_key', '_public_key', 'comment',
+)
+
+
+def get_user_snapshot(user):
+    return {
+        f.attname: getattr(user, f.attname)
+        for f in User._meta.concrete_fields
+        if f.attname not in USER_SNAPSHOT_EXCLUDE_FIELDS
+    }
+
+
+def load_user_snapshot(snapshot):
+    """
+    Build the user of the snapshot, the fields not in it are deferred,
+    so they are loaded from db when accessed, and never saved as empty
+    """
+    user = User(**snapshot)
+    for field in User._meta.concrete_fields:
+        if field.attname not in snapshot:
+            user.__dict__.pop(field.attname, None)
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+def make_token_session(user, expiration):
+    return {
+        'user': get_user_snapshot(user),
+        'expired': time.time() + expiration,
+    }
+
+
 def refresh_token(token, user, expiration=settings.TOKEN_EXPIRATION or 3600):
-    cache.set(token, user.id, expiration)
+    cache.set(token, make_token_session(user, expiration), expiration)
+
+
+def get_user_tokens(user_id):
+    tokens = get_redis_client().smembers(USER_TOKENS_CACHE_KEY.format(user_id))
+    return [token.decode('utf-8') for token in tokens]
+
+
+def add_user_token(token, user, expiration=settings.TOKEN_EXPIRATION or 3600):
+    """
+    Record tokens of the user in a redis set, so their sessions can be
+    updated when the user changed. SADD and SREM are atomic, concurrent
+    logins never drop each other's token. Tokens expired are dropped here
+    """
+    key = USER_TOKENS_CACHE_KEY.format(user.id)
+    tokens = get_user_tokens(user.id)
+    expired = set(tokens) - set(cache.get_many(tokens).keys()) if tokens else set()
+    client = get_redis_client()
+    client.sadd(key, token)
+    if expired:
+        client.srem(key, *expired)
+
+
+def refresh_user_token_sessions(user, expiration=settings.TOKEN_EXPIRATION or 3600):
+    """
+    Update the user snapshot of all it's token sessions in one round trip
+    """
+    tokens = get_user_tokens(user.id)
+    if not tokens:
+        return
+    sessions = cache.get_many(tokens)
+    if not sessions:
+        return
+    session = make_token_session(user, expiration)
+    cache.set_many({token: session for token in sessions}, expiration)
+
+
+def delete_user_token_sessions(user_id):
+    tokens = get_user_tokens(user_id)
+    if tokens:
+        cache.delete_many(tokens)
+    get_redis_client().delete(USER_TOKENS_CACHE_KEY.format(user_id))
+
+
+def get_token_user(token, expiration=settings.TOKEN_EXPIRATION or 3600):
+    """
+    Get the user of the token from it's session, no db query. The expiry
+    slides only when less than half of it left, so mostly it's one get.
+    """
+    session = cache.get(token)
+    if not isinstance(session, dict):
+        return None
+    user = load_user_snapshot(session['user'])
+    if session['expired'] - time.time() < expiration / 2:
+        refresh_token(token, user, expiration)
+    return user
 
 
 def generate_token(request, user):
@@ -167,7 +309,8 @@ def generate_token(request, user):
     token = cache.get('%s_%s' % (user.id, remote_addr))
     if not token:
         token = uuid.uuid4().hex
-        cache.set(token, user.id, expiration)
+        refresh_token(token, user, expiration)
+        add_user_token(token, user, expiration)
         cache.set('%s_%s' % (user.id, remote_addr), token, expiration)
     return token
 
@@ -181,33 +324,155 @@ def validate_ip(ip):
     return False
 
 
-def write_login_log(username, type='', ip='', user_agent=''):
+def make_login_log(username, type='', ip='', user_agent='', **kwargs):
     if not (ip and validate_ip(ip)):
         ip = ip[:15]
         city = "Unknown"
     else:
         city = get_ip_city(ip)
-    LoginLog.objects.create(
+    return LoginLog(
         username=username, type=type,
-        ip=ip, city=city, user_agent=user_agent
+        ip=ip, city=city, user_agent=user_agent, **kwargs
     )
 
 
-def get_ip_city(ip, timeout=10):
-    # Taobao ip api: http://ip.taobao.com//service/getIpInfo.php?ip=8.8.8.8
-    # Sina ip api: http://int.dpool.sina.com.cn/iplookup/iplookup.php?ip=8.8.8.8&format=json
+LOGIN_LOG_QUEUE_KEY = 'LOGIN_LOG_QUEUE'
+# Login logs can't be decoded or written, kept for checking by hand
+LOGIN_LOG_DEAD_QUEUE_KEY = 'LOGIN_LOG_DEAD_QUEUE'
 
-    url = 'http://int.dpool.sina.com.cn/iplookup/iplookup.php?ip=%s&format=json' % ip
-    try:
-        r = requests.get(url, timeout=timeout)
-    except requests.Timeout:
-        r = None
-    city = 'Unknown'
-    if r and r.status_code == 200:
+
+def write_login_logs(events):
+    logs = [
+        make_login_log(**{k: v for k, v in event.items() if k != 'retries'})
+        for event in events
+    ]
+    for log in logs:
+        log.date = timezone.localtime(log.datetime).date()
+    LoginLog.objects.bulk_create(logs, batch_size=settings.LOGIN_LOG_BATCH_SIZE)
+
+
+def write_login_log_buffered(username, type='', ip='', user_agent=''):
+    """
+    Push the login log to the redis queue, it's written with others in
+    batch by the task, at once if the queue is up to the batch size
+    """
+    event = {
+        'id': str(uuid.uuid4()), 'username': username, 'type': type,
+        'ip': ip, 'user_agent': user_agent, 'datetime': time.time(),
+    }
+    size = get_redis_client().rpush(LOGIN_LOG_QUEUE_KEY, json.dumps(event))
+    if size == settings.LOGIN_LOG_BATCH_SIZE:
+        from .tasks import write_queued_login_logs_async
+        write_queued_login_logs_async.delay()
+
+
+def pop_queued_login_logs(count):
+    client = get_redis_client()
+    pipe = client.pipeline()
+    pipe.lrange(LOGIN_LOG_QUEUE_KEY, 0, count - 1)
+    pipe.ltrim(LOGIN_LOG_QUEUE_KEY, count, -1)
+    items, _ = pipe.execute()
+    return items
+
+
+def decode_login_log_event(item):
+    event = json.loads(item.decode('utf-8'))
+    event['datetime'] = datetime.datetime.fromtimestamp(
+        event['datetime'], tz=timezone.utc
+    )
+    return event
+
+
+def encode_login_log_event(event):
+    event = dict(event, datetime=event['datetime'].timestamp())
+    return json.dumps(event)
+
+
+def requeue_login_log_events(events):
+    """
+    Push failed events back to the queue, the ones failed too many times
+    are moved to the dead letter queue, so they never block the queue
+    """
+    retry, dead = [], []
+    for event in events:
+        event['retries'] = event.get('retries', 0) + 1
+        if event['retries'] > settings.LOGIN_LOG_MAX_RETRIES:
+            dead.append(encode_login_log_event(event))
+        else:
+            retry.append(encode_login_log_event(event))
+    client = get_redis_client()
+    if retry:
+        client.rpush(LOGIN_LOG_QUEUE_KEY, *retry)
+    if dead:
+        logger.error("Login logs failed too many times: {}".format(len(dead)))
+        client.rpush(LOGIN_LOG_DEAD_QUEUE_KEY, *dead)
+
+
+def write_queued_login_logs():
+    """
+    Write login logs in the queue by batch. If a batch failed, the logs are
+    written one by one, so a bad one not fail others, the failed ones are
+    pushed back to retry later
+    """
+    count = 0
+    while True:
+        items = pop_queued_login_logs(settings.LOGIN_LOG_BATCH_SIZE)
+        if not items:
+            break
+        events = []
+        for item in items:
+            try:
+                events.append(decode_login_log_event(item))
+            except (ValueError, TypeError, KeyError) as e:
+                logger.error("Bad login log skipped: {}".format(e))
+                get_redis_client().rpush(LOGIN_LOG_DEAD_QUEUE_KEY, item)
         try:
-            data = r.json()
-            if not isinstance(data, int) and data['ret'] == 1:
-                city = data['country'] + ' ' + data['city']
-        except ValueError:
-            pass
-    return city
+            write_login_logs(events)
+            count += len(events)
+            continue
+        except Exception as e:
+            logger.error("Write login logs failed: {}".format(e))
+        failed = []
+        for event in events:
+            try:
+                write_login_logs([event])
+                count += 1
+            except Exception:
+                failed.append(event)
+        if failed:
+            requeue_login_log_events(failed)
+            break
+    return count
+
+
+def get_geoip_reader():
+    """
+    Open the GeoIP database memory mapped, once in a process
+    """
+    global _geoip_reader
+    if _geoip_reader is None:
+        path = settings.GEOIP_CITY_DB
+        if geoip2 is None or not os.path.isfile(path):
+            logger.warning("GeoIP database not found: {}".format(path))
+            _geoip_reader = False
+        else:
+            _geoip_reader = geoip2.database.Reader(
+                path, mode=geoip2.database.MODE_MMAP
+            )
+    return _geoip_reader
+
+
+@lru_cache(maxsize=4096)
+def get_ip_city(ip):
+    reader = get_geoip_reader()
+    if not reader:
+        return 'Unknown'
+    try:
+        resp = reader.city(ip)
+    except (geoip2.errors.AddressNotFoundError, ValueError):
+        return 'Unknown'
+    names = [
+        resp.country.names.get('zh-CN') or resp.country.name,
+        resp.city.names.get('zh-CN') or resp.city.name,
+    ]
+    return ' '.join([name for name in names if name]) or 'Unknown'
@@ -2,6 +2,9 @@
 
 from __future__ import unicode_literals
 import os
+import uuid
+import calendar
+import datetime
 from django import forms
 from django.shortcuts import render
 from django.contrib.auth import login as auth_login, logout as auth_logout
@@ -21,12 +24,13 @@ from django.views.generic.edit import FormView
 from formtools.wizard.views import SessionWizardView
 from django.conf import settings
 from django.utils import timezone
+from django.utils.timezone import utc
 
 from common.utils import get_object_or_none
 from common.mixins import DatetimeSearchMixin
 from ..models import User, LoginLog
 from ..utils import send_reset_password_mail
-from ..tasks import write_login_log_async
+from ..utils import write_login_log_buffered
 from .. import forms
 
 
@@ -63,7 +67,7 @@ class UserLoginView(FormView):
         else:
             login_ip = self.request.META.get('REMOTE_ADDR', '')
         user_agent = self.request.META.get('HTTP_USER_AGENT', '')
-        write_login_log_async.delay(
+        write_login_log_buffered(
             self.request.user.username, type='W',
             ip=login_ip, user_agent=user_agent
         )
@@ -229,18 +233,30 @@ class UserFirstLoginView(LoginRequiredMixin, SessionWizardView):
 
 
 class LoginLogListView(DatetimeSearchMixin, ListView):
+    """
+    Login logs is paginated by the keyset (datetime, id) of the last or the
+    first row, so a page of any depth cost an index range scan, no offset
+    and count of the whole range
+    """
     template_name = 'users/login_log_list.html'
     model = LoginLog
     paginate_by = settings.DISPLAY_PER_PAGE
     user = keyword = ""
     date_to = date_from = None
+    prev_url = next_url = None
 
     def get_queryset(self):
         self.user = self.request.GET.get('user', '')
         self.keyword = self.request.GET.get("keyword", '')
 
         queryset = super().get_queryset()
+        date_range = (
+            timezone.localtime(self.date_from).date(),
+            timezone.localtime(self.date_to).date(),
+        )
+        # Date of old logs is filled by `fill_login_log_date` at startup
         queryset = queryset.filter(
+            date__range=date_range,
             datetime__gt=self.date_from, datetime__lt=self.date_to
         )
         if self.user:
@@ -251,9 +267,64 @@ class LoginLogListView(DatetimeSearchMixin, ListView):
                 Q(city__contains=self.keyword) |
                 Q(username__contains=self.keyword)
             )
-        return queryset
+        return queryset.order_by('-datetime', '-id')
+
+    @staticmethod
+    def make_cursor(log):
+        dt = log.datetime
+        microseconds = calendar.timegm(dt.utctimetuple()) * 10**6 + dt.microsecond
+        return '{}_{}'.format(microseconds, log.id)
+
+    @staticmethod
+    def parse_cursor(cursor):
+        if not cursor:
+            return None
+        try:
+            microseconds, pk = cursor.split('_', 1)
+            microseconds = int(microseconds)
+            pk = uuid.UUID(pk)
+        except ValueError:
+            return None
+        dt = datetime.datetime.fromtimestamp(microseconds // 10**6, tz=utc)
+        return dt.replace(microsecond=microseconds % 10**6), pk
+
+    def get_cursor_url(self, key, log):
+        query = self.request.GET.copy()
+        query.pop('after', None)
+        query.pop('before', None)
+        query[key] = self.make_cursor(log)
+        return '?' + query.urlencode()
+
+    def paginate_queryset(self, queryset, page_size):
+        after = self.parse_cursor(self.request.GET.get('after'))
+        before = self.parse_cursor(self.request.GET.get('before'))
+
+        if before:
+            dt, pk = before
+            queryset = queryset.filter(
+                Q(datetime__gt=dt) | Q(datetime=dt, id__gt=pk)
+            ).order_by('datetime', 'id')
+            logs = list(queryset[:page_size+1])
+            has_prev, has_next = len(logs) > page_size, True
+            logs = logs[:page_size][::-1]
+        else:
+            if after:
+                dt, pk = after
+                queryset = queryset.filter(
+                    Q(datetime__lt=dt) | Q(datetime=dt, id__lt=pk)
+                )
+            logs = list(queryset[:page_size+1])
+            has_prev, has_next = after is not None, len(logs) > page_size
+            logs = logs[:page_size]
+
+        if logs and has_prev:
+            self.prev_url = self.get_cursor_url('before', logs[0])
+        if logs and has_next:
+            self.next_url = self.get_cursor_url('after', logs[-1])
+        return None, None, logs, False
 
     def get_context_data(self, **kwargs):
+        user_list = User.objects.values_list('username', flat=True)
         context = {
             'app': _('Users'),
             'action': _('Login log list'),
@@ -261,7 +332,12 @@ class LoginLogListView(DatetimeSearchMixin, ListView):
             'date_to': self.date_to,
             'user': self.user,
             'keyword': self.keyword,
-            'user_list': set(LoginLog.objects.all().values_list('username', flat=True))
+            'user_list': set(user_list),
         }
         kwargs.update(context)
-        return super().get_context_data(**kwargs)
\ No newline at end of file
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'prev_url': self.prev_url,
+            'next_url': self.next_url,
+        })
+        return context
@@ -57,6 +57,33 @@ class Config:
         'port': REDIS_PORT,
     }
 
+    # Fleet wide ansible runs are split to shards running on celery workers
+    # ANSIBLE_SHARD_SIZE = 200
+    # ANSIBLE_SHARD_MAX_PARALLEL = 8
+    # ANSIBLE_SHARD_FORKS = 10
+    # ANSIBLE_SHARD_QUEUE = 'ansible'
+
+    # Max concurrent ssh handshakes of connectivity test, in one worker,
+    # and threads doing the ssh auth
+    # SSH_PROBE_CONCURRENCY = 500
+    # SSH_PROBE_THREADS = 50
+
+    # Access key auth info cache seconds, and reject replayed signatures
+    # ACCESS_KEY_CACHE_TTL = 300
+    # ACCESS_KEY_NONCE_CHECK = False
+
+    # Local GeoLite2 city database used to resolve login city
+    # GEOIP_CITY_DB = os.path.join(BASE_DIR, 'data', 'geoip', 'GeoLite2-City.mmdb')
+    # LOGIN_LOG_BATCH_SIZE = 500
+    # LOGIN_LOG_FLUSH_INTERVAL = 10
+    # LOGIN_LOG_MAX_RETRIES = 3
+    # LOGIN_LOG_KEEP_DAYS = 365
+
+    # Results of adhoc run history saved in db and older than hot days are
+    # archived, history older than retention days are deleted
+    # ANSIBLE_HISTORY_HOT_DAYS = 7
+    # ANSIBLE_HISTORY_RETENTION_DAYS = 180
+
     def __init__(self):
         pass
 